@@ -0,0 +1,198 @@
+"""
+Scaled dot-product attention with a backend switch.
+
+MultiHeadAttentionBlock (model.ipynb) and SelfAttention (decoder_only.py)
+used to build the full (B, heads, T, S) score tensor by hand. attention()
+routes through torch.nn.functional.scaled_dot_product_attention when
+PyTorch has it, which picks a fused kernel and skips materializing the
+scores where it can. The hand-written path stays as the reference.
+
+Masks follow the SDPA convention: bool, True = may attend, broadcastable
+to (B, heads, T, S). 0/1 float or int masks (model.ipynb's "mask == 0 is
+blocked") are converted.
+
+Check: python attention.py --check
+Bench: python attention.py --benchmark --seq-lens 128 256 512 1024 2048
+"""
+
+import argparse
+import math
+import multiprocessing
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+import torch.nn.functional as F
+
+BACKENDS = ('auto', 'sdpa', 'manual')
+HAS_SDPA = hasattr(F, 'scaled_dot_product_attention')
+
+
+def resolve_backend(backend='auto'):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown attention backend '{backend}', expected one of {BACKENDS}")
+    if backend == 'auto':
+        return 'sdpa' if HAS_SDPA else 'manual'
+    if backend == 'sdpa' and not HAS_SDPA:
+        raise RuntimeError("scaled_dot_product_attention needs PyTorch 2.0 or newer")
+    return backend
+
+
+def _bool_mask(mask):
+    if mask is None or mask.dtype == torch.bool:
+        return mask
+    return mask != 0
+
+
+def manual_attention(q, k, v, mask=None, is_causal=False, dropout_p=0.0, return_scores=False):
+    """Reference path: softmax(q k^T / sqrt(d)) v with the full score tensor in memory."""
+    T, S = q.size(-2), k.size(-2)
+    scores = (q @ k.transpose(-2, -1)) / math.sqrt(q.size(-1))
+    if is_causal:
+        causal = torch.ones(T, S, dtype=torch.bool, device=q.device).tril()
+        scores = scores.masked_fill(~causal, float('-inf'))
+    if mask is not None:
+        scores = scores.masked_fill(~_bool_mask(mask), float('-inf'))
+    att = scores.softmax(dim=-1)
+    if dropout_p > 0:
+        att = F.dropout(att, p=dropout_p)
+    out = att @ v
+    return (out, att) if return_scores else out
+
+
+def attention(q, k, v, mask=None, is_causal=False, dropout_p=0.0, backend='auto'):
+    """q (B, heads, T, d), k/v (B, heads, S, d) -> (B, heads, T, d).
+
+    Pass is_causal=True instead of a causal mask when there is no padding:
+    SDPA can then use its causal kernel without reading a mask at all.
+    dropout_p is applied as given, so pass 0 in eval mode.
+    """
+    if resolve_backend(backend) == 'manual':
+        return manual_attention(q, k, v, mask, is_causal, dropout_p)
+    mask = _bool_mask(mask)
+    if is_causal and mask is not None:
+        # SDPA rejects both at once; fold the causal part into the mask
+        T, S = q.size(-2), k.size(-2)
+        mask = mask & torch.ones(T, S, dtype=torch.bool, device=q.device).tril()
+        is_causal = False
+    return F.scaled_dot_product_attention(q, k, v, attn_mask=mask, dropout_p=dropout_p, is_causal=is_causal)
+
+
+def padding_mask(lengths, max_len, left=False):
+    """(B,) lengths -> (B, 1, 1, max_len) key mask, True on real tokens."""
+    positions = torch.arange(max_len, device=lengths.device)
+    if left:
+        keep = positions[None, :] >= (max_len - lengths)[:, None]
+    else:
+        keep = positions[None, :] < lengths[:, None]
+    return keep[:, None, None, :]
+
+
+def check_equivalence(batch_size=3, num_heads=4, head_dim=32, seq_len=37, atol=1e-5, seed=0, verbose=True):
+    """Compare sdpa and manual outputs on causal, padded, causal+padded and cross-attention cases."""
+    if not HAS_SDPA:
+        raise RuntimeError("scaled_dot_product_attention is not available in this PyTorch")
+    g = torch.Generator().manual_seed(seed)
+    q, k, v = (torch.randn(batch_size, num_heads, seq_len, head_dim, generator=g) for _ in range(3))
+    lengths = torch.randint(seq_len // 2, seq_len + 1, (batch_size,), generator=g)
+    lengths[0] = seq_len
+    pad = padding_mask(lengths, seq_len)
+    # Cross-attention: fewer queries than keys
+    q_cross = torch.randn(batch_size, num_heads, seq_len // 3, head_dim, generator=g)
+    float_pad = pad.float()
+
+    cases = {
+        'no mask': (q, dict()),
+        'causal': (q, dict(is_causal=True)),
+        'padding': (q, dict(mask=pad)),
+        'causal + padding': (q, dict(mask=pad, is_causal=True)),
+        'cross + padding': (q_cross, dict(mask=pad)),
+        '0/1 float mask': (q, dict(mask=float_pad)),
+    }
+    results = {}
+    for name, (query, kwargs) in cases.items():
+        ref = manual_attention(query, k, v, **kwargs)
+        out = attention(query, k, v, backend='sdpa', **kwargs)
+        diff = (ref - out).abs().max().item()
+        results[name] = diff
+        if verbose:
+            print(f"  {name:<18} max |sdpa - manual| = {diff:.2e}")
+        if not diff <= atol:
+            raise AssertionError(f"attention backends differ on '{name}': {diff:.2e} > {atol:.0e}")
+    return results
+
+
+def _measure(args):
+    """Child process: peak RSS growth (MB) and mean seconds for one backend and length."""
+    backend, batch_size, num_heads, head_dim, seq_len, repeats, threads = args
+    if threads:
+        torch.set_num_threads(threads)
+    torch.manual_seed(0)
+    q, k, v = (torch.randn(batch_size, num_heads, seq_len, head_dim) for _ in range(3))
+    lengths = torch.full((batch_size,), seq_len)
+    lengths[-1] = seq_len // 2
+    mask = padding_mask(lengths, seq_len)
+
+    with torch.inference_mode():
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        attention(q, k, v, mask=mask, is_causal=True, backend=backend)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        for _ in range(repeats):
+            attention(q, k, v, mask=mask, is_causal=True, backend=backend)
+        elapsed = (time.perf_counter() - start) / repeats
+    # ru_maxrss is KB on Linux
+    return (peak - before) / 1024, elapsed
+
+
+def benchmark(seq_lens=(128, 256, 512, 1024, 2048), batch_size=4, num_heads=8, head_dim=64, repeats=5, threads=None):
+    """Causal + padding attention on CPU; each measurement in a fresh process so peak RSS is its own."""
+    if not HAS_SDPA:
+        raise RuntimeError("scaled_dot_product_attention is not available in this PyTorch")
+    print(f"B={batch_size}, heads={num_heads}, head_dim={head_dim}, causal + padding mask")
+    print(f"{'seq_len':>8} | {'manual ms':>10} {'sdpa ms':>10} {'speedup':>8} | "
+          f"{'manual MB':>10} {'sdpa MB':>10} {'scores MB':>10}")
+    results = []
+    ctx = multiprocessing.get_context('spawn')
+    for seq_len in seq_lens:
+        row = {'seq_len': seq_len}
+        for backend in ('manual', 'sdpa'):
+            with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+                mem, secs = pool.submit(_measure, (backend, batch_size, num_heads, head_dim, seq_len,
+                                                   repeats, threads)).result()
+            row[backend] = {'ms': secs * 1000, 'peak_mb': mem}
+        # Size of one float32 (B, heads, T, T) tensor, what the manual path allocates several of
+        scores_mb = batch_size * num_heads * seq_len * seq_len * 4 / 2**20
+        print(f"{seq_len:>8} | {row['manual']['ms']:>10.2f} {row['sdpa']['ms']:>10.2f} "
+              f"{row['manual']['ms'] / row['sdpa']['ms']:>7.2f}x | {row['manual']['peak_mb']:>10.1f} "
+              f"{row['sdpa']['peak_mb']:>10.1f} {scores_mb:>10.1f}")
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Attention backend check and CPU benchmark')
+    parser.add_argument('--check', action='store_true', help='numerical equivalence of sdpa vs manual')
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--seq-lens', type=int, nargs='+', default=[128, 256, 512, 1024, 2048])
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--heads', type=int, default=8)
+    parser.add_argument('--head-dim', type=int, default=64)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+
+    if not (args.check or args.benchmark):
+        parser.print_help()
+        return
+    if args.check:
+        print("Equivalence check:")
+        check_equivalence()
+        print("✓ sdpa matches manual attention")
+    if args.benchmark:
+        benchmark(args.seq_lens, args.batch_size, args.heads, args.head_dim, args.repeats, args.threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Crawl a folder of .txt files, drop exact duplicate files and concatenate
+the rest. Streaming replacement for crawl_and_combine_txt_files in
+news.ipynb, which MD5-hashes every file in 4 KB reads and keeps all
+content in memory before writing.
+
+- Every file is inspected once in a worker pool over memory-mapped reads:
+  whitespace-only files are skipped like in the notebook, and files that
+  are not valid UTF-8 are flagged for re-encoding.
+- Files are grouped by size first; a file with a unique size cannot be a
+  duplicate and is not hashed. Same-size candidates are hashed (xxHash
+  when installed, CRC32 otherwise) and hash matches are confirmed
+  byte-for-byte so a weak hash can never drop a real article.
+- UTF-8 files are written by copying their bytes straight from disk
+  (os.sendfile where available). Other files are read as latin-1 and
+  re-encoded, as the notebook did, so the output is always valid UTF-8.
+
+Run: python combine_files.py nepalinewsdataset -o news.txt
+"""
+
+import argparse
+import filecmp
+import mmap
+import os
+import shutil
+import time
+import zlib
+from collections import defaultdict
+from multiprocessing import Pool
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+COPY_BUFFER = 16 * 1024 * 1024
+
+
+def inspect_file(args):
+    """Worker: (path, hash or None, blank, utf8) for one file, read once via mmap.
+
+    The non-cryptographic hash is only computed when need_hash is set.
+    """
+    path, need_hash = args
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            data = m[:]
+    except (OSError, ValueError) as e:
+        print(f"Error reading {path}: {e}")
+        return path, None, True, False
+    try:
+        text = data.decode('utf-8')
+        utf8 = True
+    except UnicodeDecodeError:
+        text = data.decode('latin-1')
+        utf8 = False
+    digest = None
+    if need_hash:
+        digest = xxhash.xxh3_64_intdigest(data) if xxhash is not None else zlib.crc32(data)
+    return path, digest, not text.strip(), utf8
+
+
+def find_txt_files(root_folder):
+    files = []
+    for root, dirs, names in os.walk(root_folder):
+        dirs.sort()
+        for name in sorted(names):
+            if name.endswith('.txt'):
+                files.append(os.path.join(root, name))
+    return files
+
+
+def find_unique_files(paths, workers=None, verbose=True):
+    """Return (unique paths in input order, paths that are not UTF-8, stats).
+
+    Empty and whitespace-only files are dropped. The first file of each duplicate set wins.
+    """
+    stats = {'found': len(paths), 'empty': 0, 'duplicates': 0, 'hashed_files': 0, 'hashed_bytes': 0,
+             'non_utf8': 0}
+
+    by_size = defaultdict(list)
+    sizes = {}
+    for path in paths:
+        try:
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"Error reading {path}: {e}")
+            continue
+        if size == 0:
+            stats['empty'] += 1
+            continue
+        sizes[path] = size
+        by_size[size].append(path)
+
+    candidates = [p for group in by_size.values() if len(group) > 1 for p in group]
+    stats['hashed_files'] = len(candidates)
+    stats['hashed_bytes'] = sum(sizes[p] for p in candidates)
+    if verbose:
+        print(f"Size grouping: {len(candidates)} of {len(sizes)} files need hashing "
+              f"({stats['hashed_bytes'] / (1024*1024):.1f} MB)")
+
+    hashes = {}
+    blank = set()
+    non_utf8 = set()
+    if sizes:
+        workers = workers or os.cpu_count() or 1
+        tasks = [(path, len(by_size[size]) > 1) for path, size in sizes.items()]
+        chunksize = max(1, len(tasks) // (workers * 8))
+        with Pool(workers) as pool:
+            for path, digest, is_blank, utf8 in pool.imap_unordered(inspect_file, tasks, chunksize=chunksize):
+                hashes[path] = digest
+                if is_blank:
+                    blank.add(path)
+                if not utf8:
+                    non_utf8.add(path)
+
+    # Walk in input order so the first file of each duplicate set is the one kept
+    kept_by_key = defaultdict(list)
+    unique = []
+    for path in paths:
+        if path not in sizes:
+            continue
+        if path in blank:
+            stats['empty'] += 1
+            continue
+        if len(by_size[sizes[path]]) == 1:
+            unique.append(path)
+            continue
+        digest = hashes.get(path)
+        if digest is None:
+            continue
+        key = (sizes[path], digest)
+        if any(filecmp.cmp(path, kept, shallow=False) for kept in kept_by_key[key]):
+            stats['duplicates'] += 1
+            continue
+        kept_by_key[key].append(path)
+        unique.append(path)
+
+    stats['unique'] = len(unique)
+    non_utf8 &= set(unique)
+    stats['non_utf8'] = len(non_utf8)
+    return unique, non_utf8, stats
+
+
+def copy_into(out, path, utf8=True):
+    """Append a file to the open binary output; returns bytes written.
+
+    UTF-8 files are copied without buffering them in Python. Others are read
+    as latin-1 and re-encoded, so the output stays valid UTF-8.
+    """
+    if not utf8:
+        with open(path, 'r', encoding='latin-1') as src:
+            data = src.read().encode('utf-8')
+        out.write(data)
+        return len(data)
+    out.flush()
+    with open(path, 'rb') as src:
+        if hasattr(os, 'sendfile'):
+            try:
+                offset = 0
+                size = os.fstat(src.fileno()).st_size
+                while offset < size:
+                    sent = os.sendfile(out.fileno(), src.fileno(), offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                return offset
+            except OSError:
+                src.seek(0)
+        shutil.copyfileobj(src, out, COPY_BUFFER)
+        return src.tell()
+
+
+def crawl_and_combine_txt_files(root_folder, output_file="news.txt", workers=None, verbose=True):
+    """Dedupe and concatenate every .txt file under root_folder into output_file."""
+    start_time = time.time()
+    if verbose:
+        print(f"Scanning folder structure from: {root_folder}")
+        print("-" * 50)
+    txt_files = find_txt_files(root_folder)
+    if verbose:
+        print(f"Found {len(txt_files)} .txt files")
+    if not txt_files:
+        print("No .txt files found!")
+        return None
+
+    unique, non_utf8, stats = find_unique_files(txt_files, workers=workers, verbose=verbose)
+    hash_time = time.time() - start_time
+
+    separator = '=' * 80
+    written = 0
+    with open(output_file, 'wb', buffering=COPY_BUFFER) as out:
+        out.write((f"{separator}\n"
+                   f"COMBINED NEPALI NEWS DATASET\n"
+                   f"Generated from: {root_folder}\n"
+                   f"Total unique articles: {len(unique)}\n"
+                   f"Generated on: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+                   f"{separator}\n").encode('utf-8'))
+        for path in unique:
+            relative_path = os.path.relpath(path, root_folder)
+            out.write(f"\n\n{separator}\nSource: {relative_path}\n{separator}\n\n".encode('utf-8'))
+            written += copy_into(out, path, utf8=path not in non_utf8)
+
+    elapsed = time.time() - start_time
+    stats['bytes_written'] = written
+    stats['seconds'] = elapsed
+    if verbose:
+        print(f"\n{'='*60}")
+        print("Summary:")
+        print(f"  Total files found: {stats['found']}")
+        print(f"  Empty files skipped: {stats['empty']}")
+        print(f"  Re-encoded from latin-1: {stats['non_utf8']}")
+        print(f"  Files hashed: {stats['hashed_files']} ({hash_time:.1f}s)")
+        print(f"  Unique files: {stats['unique']}")
+        print(f"  Duplicate files skipped: {stats['duplicates']}")
+        print(f"  Output size: {written / (1024*1024):.2f} MB in {elapsed:.1f}s "
+              f"({written / (1024*1024) / max(elapsed, 1e-9):.1f} MB/s)")
+        print(f"{'='*60}\n")
+        print(f"✅ Successfully created {output_file}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dedupe and concatenate .txt files under a folder')
+    parser.add_argument('root_folder')
+    parser.add_argument('-o', '--output', default='news.txt')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.root_folder):
+        print(f"Error: Folder '{args.root_folder}' not found!")
+        return
+    crawl_and_combine_txt_files(args.root_folder, args.output, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Parallel, line-aligned cleaner for the Nepali/English text corpora.
+Replaces the copy-pasted clean_nepali_text cells in practise.ipynb,
+news.ipynb and nepali_wikipedia.ipynb.
+
+Run: python corpus_cleaner.py ne.txt ne_cleaned.txt
+     python corpus_cleaner.py cc100_en_200k.txt cc100_en_cleaned.txt --mode english
+     python corpus_cleaner.py ne.txt ne_cleaned.txt --languages ne,mixed
+Or:  from corpus_cleaner import clean_file, clean_nepali_text
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+import unicodedata
+from collections import Counter
+from multiprocessing import Pool
+
+# The language tagger lives with the scraper so reviews and corpus lines get the same tags
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'daraz_product_review'))
+from daraz_product_review.language_tagger import TAGS, LanguageTagger  # noqa: E402
+
+# Precompiled once per process instead of on every call
+NEPALI_DISALLOWED = re.compile(
+    r'[^'
+    r'a-zA-Z'                    # English
+    r'\u0900-\u097F'             # Devanagari including ।॥
+    r'0-9\u0966-\u096F'          # Digits
+    r'\s'                        # Whitespace
+    r'.,!?;:()\[\]{}\-\'\"/\\'   # Punctuation
+    r']+'
+)
+ENGLISH_DISALLOWED = re.compile(
+    r'[^'
+    r'a-zA-Z'                    # English letters
+    r'0-9'                       # Digits
+    r'\s'                        # Whitespace
+    r'.,!?;:()\-_\'"'            # Basic punctuation
+    r']+'
+)
+MULTI_SPACE = re.compile(r' +')
+MULTI_NEWLINE = re.compile(r'\n+')
+MULTI_TAB = re.compile(r'\t+')
+
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024  # 8 MB of input per task
+
+_tagger = None  # one per worker process, so the detector cache survives across blocks
+
+
+def get_tagger():
+    global _tagger
+    if _tagger is None:
+        _tagger = LanguageTagger()
+    return _tagger
+
+
+def clean_nepali_text(text):
+    """Clean Nepali text while preserving Devanagari punctuation."""
+    text = unicodedata.normalize('NFC', text)
+    text = NEPALI_DISALLOWED.sub(' ', text)
+    text = MULTI_SPACE.sub(' ', text)
+    text = MULTI_NEWLINE.sub('\n', text)
+    text = MULTI_TAB.sub(' ', text)
+    return text.strip()
+
+
+def clean_english_text(text):
+    """Simple English cleaner matching clean_english_text_simple in news.ipynb."""
+    text = unicodedata.normalize('NFKC', text)
+    text = ENGLISH_DISALLOWED.sub(' ', text)
+    text = MULTI_SPACE.sub(' ', text)
+    text = MULTI_NEWLINE.sub('\n', text)
+    text = MULTI_TAB.sub(' ', text)
+    return text.strip()
+
+
+def keep_nepali_line(line, min_length):
+    return len(line) >= min_length
+
+
+def keep_english_line(line, min_length):
+    # Same filter as news.ipynb: 20-500 chars and at least 3 words
+    return max(min_length, 20) <= len(line) <= 500 and len(line.split()) >= 3
+
+
+MODES = {
+    'nepali': (clean_nepali_text, keep_nepali_line),
+    'english': (clean_english_text, keep_english_line),
+}
+
+
+def iter_line_aligned_blocks(path, block_size=DEFAULT_BLOCK_SIZE):
+    """Yield (start, end) byte ranges that always end on a newline.
+
+    Splitting on b'\\n' can never cut a UTF-8 sequence in half, unlike the
+    1 MB text-mode reads in the notebooks.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + block_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            yield start, end
+            start = end
+
+
+def clean_block(args):
+    """Worker: read one byte range, clean it in one pass and return kept lines and per-tag counts."""
+    path, start, end, mode, min_length, languages = args
+    clean, keep = MODES[mode]
+    with open(path, 'rb') as f:
+        f.seek(start)
+        raw = f.read(end - start)
+
+    text = raw.decode('utf-8', errors='ignore')
+    lines_in = text.count('\n') + (0 if text.endswith('\n') or not text else 1)
+
+    # Normalization and regexes run once over the whole block, not per line
+    cleaned = clean(text)
+    kept = [line.strip() for line in cleaned.split('\n')]
+    kept = [line for line in kept if keep(line, min_length)]
+    tag_counts = Counter()
+    if languages:
+        tags = get_tagger().tag_batch(kept)
+        tag_counts.update(tags)
+        kept = [line for line, tag in zip(kept, tags) if tag in languages]
+    output = '\n'.join(kept) + '\n' if kept else ''
+    return output, lines_in, len(kept), len(raw), tag_counts
+
+
+def clean_file(input_file, output_file, mode='nepali', workers=None, block_size=DEFAULT_BLOCK_SIZE,
+               min_length=5, languages=None, verbose=True):
+    """Clean input_file into output_file across a process pool.
+
+    languages: optional language tags (see language_tagger.TAGS) to keep;
+    lines passing the length filter are tagged and the rest dropped.
+    Output order matches input order. Returns a stats dict.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {sorted(MODES)}")
+    languages = frozenset(languages or ())
+    unknown = languages - set(TAGS)
+    if unknown:
+        raise ValueError(f"Unknown language tags {sorted(unknown)}, expected some of {list(TAGS)}")
+    workers = workers or os.cpu_count() or 1
+    tasks = ((input_file, start, end, mode, min_length, languages)
+             for start, end in iter_line_aligned_blocks(input_file, block_size))
+
+    stats = {'lines_in': 0, 'lines_kept': 0, 'bytes_in': 0, 'bytes_out': 0, 'blocks': 0}
+    tag_counts = Counter()
+    start_time = time.time()
+    if verbose:
+        print(f"📖 Cleaning {input_file} with {workers} workers ({block_size / (1024*1024):.0f} MB blocks)...")
+
+    with open(output_file, 'w', encoding='utf-8') as out:
+        if workers == 1:
+            results = map(clean_block, tasks)
+            pool = None
+        else:
+            pool = Pool(workers)
+            # imap keeps results in input order while workers run ahead
+            results = pool.imap(clean_block, tasks)
+        try:
+            for output, lines_in, lines_kept, bytes_in, block_tags in results:
+                tag_counts.update(block_tags)
+                out.write(output)
+                stats['blocks'] += 1
+                stats['lines_in'] += lines_in
+                stats['lines_kept'] += lines_kept
+                stats['bytes_in'] += bytes_in
+                stats['bytes_out'] += len(output.encode('utf-8'))
+                if verbose and stats['blocks'] % 10 == 0:
+                    elapsed = max(time.time() - start_time, 1e-9)
+                    print(f"  Processed {stats['blocks']} blocks "
+                          f"({stats['bytes_in'] / (1024*1024) / elapsed:.1f} MB/s)...")
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    elapsed = max(time.time() - start_time, 1e-9)
+    stats['lines_dropped'] = stats['lines_in'] - stats['lines_kept']
+    stats['seconds'] = elapsed
+    stats['mb_per_second'] = stats['bytes_in'] / (1024 * 1024) / elapsed
+    stats['lines_per_second'] = stats['lines_in'] / elapsed
+    if languages:
+        stats['languages'] = {tag: tag_counts[tag] for tag in TAGS}
+
+    if verbose:
+        print(f"\n✓ Done in {elapsed:.1f}s")
+        print(f"Lines in: {stats['lines_in']:,}")
+        print(f"Lines kept: {stats['lines_kept']:,}")
+        print(f"Lines dropped: {stats['lines_dropped']:,}")
+        if languages:
+            print("Language tags: " + ", ".join(f"{tag}={count:,}" for tag, count in stats['languages'].items()
+                                                if count) + f" (kept {', '.join(sorted(languages))})")
+        print(f"Throughput: {stats['mb_per_second']:.1f} MB/s, {stats['lines_per_second']:,.0f} lines/s")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parallel Nepali/English corpus cleaner')
+    parser.add_argument('input_file')
+    parser.add_argument('output_file')
+    parser.add_argument('--mode', choices=sorted(MODES), default='nepali')
+    parser.add_argument('--workers', type=int, default=None, help='default: all cores')
+    parser.add_argument('--block-mb', type=float, default=DEFAULT_BLOCK_SIZE / (1024 * 1024))
+    parser.add_argument('--min-length', type=int, default=5)
+    parser.add_argument('--languages', default=None,
+                        help=f"comma-separated tags to keep, from {','.join(TAGS)} (default: no tagging)")
+    args = parser.parse_args()
+
+    languages = args.languages.split(',') if args.languages else None
+    clean_file(args.input_file, args.output_file, mode=args.mode, workers=args.workers,
+               block_size=int(args.block_mb * 1024 * 1024), min_length=args.min_length, languages=languages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+GPT-style decoder-only model from decoder_only.ipynb, with KV-cached
+incremental generation.
+
+The notebook's SelfAttention recomputes Q/K/V for the whole prefix on every
+call and rebuilds its torch.tril mask (on the default device) whenever T
+changes, so generating n tokens costs O(n^2) projections. Here:
+
+- the causal mask is built once as a bool buffer of max_len x max_len and
+  sliced, so it follows the model's device;
+- KVCache preallocates per-layer key/value tensors and each step only
+  projects the new token;
+- batched prompts of different lengths are left-padded, with a key padding
+  mask and per-sequence position ids;
+- attention goes through attention.py, so it uses
+  scaled_dot_product_attention when available (attn_backend='manual' keeps
+  the hand-written path);
+- packed training sequences (packing.py) pass document_ids so tokens only
+  attend within their own document, with positions restarting per document.
+
+Run: python decoder_only.py --benchmark
+Use: from decoder_only import GPT, generate
+"""
+
+import argparse
+import math
+import time
+
+import torch
+import torch.nn as nn
+
+from attention import attention, resolve_backend
+
+
+# -------------------------------
+# GELU Activation (GPT uses this)
+# -------------------------------
+class GELU(nn.Module):
+    def forward(self, x):
+        return 0.5 * x * (1 + torch.tanh(math.sqrt(2 / math.pi) * (x + 0.044715 * (x ** 3))))
+
+
+# -------------------------------
+# Per-layer key/value cache
+# -------------------------------
+class KVCache:
+    """Preallocated keys/values for every layer; written in place, never concatenated."""
+
+    def __init__(self, n_layers, batch_size, num_heads, max_len, head_dim, device=None, dtype=None):
+        shape = (n_layers, batch_size, num_heads, max_len, head_dim)
+        self.k = torch.zeros(shape, device=device, dtype=dtype)
+        self.v = torch.zeros(shape, device=device, dtype=dtype)
+        self.max_len = max_len
+        self.length = 0
+
+    def update(self, layer, k, v):
+        """Store this step's k/v for one layer and return everything cached so far."""
+        T = k.size(2)
+        end = self.length + T
+        if end > self.max_len:
+            raise ValueError(f"KV cache full ({self.max_len} positions)")
+        self.k[layer, :, :, self.length:end] = k
+        self.v[layer, :, :, self.length:end] = v
+        return self.k[layer, :, :, :end], self.v[layer, :, :, :end]
+
+    def advance(self, T):
+        self.length += T
+
+
+# -------------------------------
+# Multi-Head Self Attention
+# -------------------------------
+class SelfAttention(nn.Module):
+    def __init__(self, d_model, num_heads, layer_idx=0, backend='auto'):
+        super().__init__()
+        assert d_model % num_heads == 0
+
+        self.d_model = d_model
+        self.num_heads = num_heads
+        self.head_dim = d_model // num_heads
+        self.layer_idx = layer_idx
+        self.backend = resolve_backend(backend)
+
+        # Combined QKV projection (like GPT-2)
+        self.qkv = nn.Linear(d_model, 3 * d_model)
+        self.output_proj = nn.Linear(d_model, d_model)
+
+    def forward(self, x, mask, cache=None, is_causal=False):
+        #batch, sequence_length, d_model
+        B, T, D = x.size()
+
+        qkv = self.qkv(x)  # (B, T, 3*d_model)
+        q, k, v = qkv.split(self.d_model, dim=2)
+
+        # Shape into heads
+        q = q.view(B, T, self.num_heads, self.head_dim).transpose(1, 2)
+        k = k.view(B, T, self.num_heads, self.head_dim).transpose(1, 2)
+        v = v.view(B, T, self.num_heads, self.head_dim).transpose(1, 2)
+
+        # Only the new positions were projected; the prefix comes from the cache
+        if cache is not None:
+            k, v = cache.update(self.layer_idx, k, v)
+
+        # (B, heads, T, head_dim); keys/values span S = cached + new positions
+        out = attention(q, k, v, mask=mask, is_causal=is_causal, backend=self.backend)
+        out = out.transpose(1, 2).contiguous().view(B, T, D)
+
+        return self.output_proj(out)
+
+
+# -------------------------------
+# Feed Forward MLP (GPT uses GELU)
+# -------------------------------
+class FeedForward(nn.Module):
+    def __init__(self, d_model, ff_dim):
+        super().__init__()
+        self.fc1 = nn.Linear(d_model, ff_dim)
+        self.gelu = GELU()
+        self.fc2 = nn.Linear(ff_dim, d_model)
+
+    def forward(self, x):
+        return self.fc2(self.gelu(self.fc1(x)))
+
+
+# -------------------------------
+# Decoder Block
+# -------------------------------
+class DecoderBlock(nn.Module):
+    def __init__(self, d_model, num_heads, ff_dim, layer_idx=0, backend='auto'):
+        super().__init__()
+        self.ln1 = nn.LayerNorm(d_model)
+        self.attn = SelfAttention(d_model, num_heads, layer_idx, backend)
+        self.ln2 = nn.LayerNorm(d_model)
+        self.ff = FeedForward(d_model, ff_dim)
+
+    def forward(self, x, mask, cache=None, is_causal=False):
+        # 1. Attention + Residual
+        x = x + self.attn(self.ln1(x), mask, cache, is_causal)
+
+        # 2. MLP + Residual
+        x = x + self.ff(self.ln2(x))
+
+        return x
+
+
+# -------------------------------
+# GPT-Style Decoder-only Model
+# -------------------------------
+class GPT(nn.Module):
+    def __init__(self, vocab_size, d_model=512, num_heads=8, n_layers=6, max_len=1024, ff_dim=2048,
+                 attn_backend='auto'):
+        super().__init__()
+        self.max_len = max_len
+        self.num_heads = num_heads
+        self.head_dim = d_model // num_heads
+        self.n_layers = n_layers
+
+        self.tok_emb = nn.Embedding(vocab_size, d_model)
+        self.pos_emb = nn.Embedding(max_len, d_model)
+
+        self.blocks = nn.ModuleList([
+            DecoderBlock(d_model, num_heads, ff_dim, layer_idx=i, backend=attn_backend)
+        for i in range(n_layers)])
+
+        self.ln_final = nn.LayerNorm(d_model)
+        self.lm_head = nn.Linear(d_model, vocab_size, bias=False)
+
+        # Built once; slicing keeps it on whatever device the model is on
+        self.register_buffer("causal_mask", torch.tril(torch.ones(max_len, max_len, dtype=torch.bool)),
+                             persistent=False)
+
+    def new_cache(self, batch_size, max_len=None):
+        p = self.lm_head.weight
+        return KVCache(self.n_layers, batch_size, self.num_heads, max_len or self.max_len, self.head_dim,
+                       device=p.device, dtype=p.dtype)
+
+    def build_mask(self, past, T, attention_mask=None, document_ids=None):
+        """(B or 1, 1, T, past+T) bool mask: causal, minus padded keys and keys from other documents.
+
+        A query may always see itself, so rows for padding positions never
+        become all -inf (which would turn softmax into NaN).
+        """
+        total = past + T
+        mask = self.causal_mask[past:total, :total][None, None]
+        if document_ids is not None:
+            mask = mask & (document_ids[:, None, past:total, None] == document_ids[:, None, None, :total])
+        if attention_mask is None:
+            return mask
+        keys = attention_mask[:, None, None, :total].bool()
+        own = torch.arange(past, total, device=mask.device)[:, None] == torch.arange(total, device=mask.device)
+        return mask & (keys | own[None, None])
+
+    def forward(self, idx, cache=None, attention_mask=None, position_ids=None, document_ids=None):
+        """idx (B, T) -> logits (B, T, vocab).
+
+        attention_mask (B, past+T) marks real (non-pad) tokens, including
+        those already in the cache. position_ids defaults to past..past+T-1.
+        document_ids (B, past+T) labels each token's document in a packed
+        sequence; attention never crosses between different ids.
+        """
+        x = self.hidden_states(idx, cache, attention_mask, position_ids, document_ids)
+        logits = self.lm_head(x)  # (B, T, vocab_size)
+        return logits
+
+    def hidden_states(self, idx, cache=None, attention_mask=None, position_ids=None, document_ids=None):
+        """Final layer-normed hidden states (B, T, d_model), for heads other than lm_head."""
+        B, T = idx.size()
+        past = cache.length if cache is not None else 0
+
+        if position_ids is None:
+            position_ids = torch.arange(past, past + T, device=idx.device)
+        tok = self.tok_emb(idx)
+        pos = self.pos_emb(position_ids)
+
+        x = tok + pos  # input embeddings
+        # Plain causal prefill needs no mask tensor; SDPA has a dedicated kernel for it
+        is_causal = attention_mask is None and document_ids is None and past == 0
+        mask = None if is_causal else self.build_mask(past, T, attention_mask, document_ids)
+
+        for block in self.blocks:
+            x = block(x, mask, cache, is_causal)
+        if cache is not None:
+            cache.advance(T)
+
+        return self.ln_final(x)
+
+
+# -------------------------------
+# Sampling and generation
+# -------------------------------
+def sample_next(logits, strategy='greedy', temperature=1.0, top_k=50, top_p=0.9, generator=None):
+    """Pick the next token id per row of logits (B, vocab)."""
+    if strategy == 'greedy':
+        return logits.argmax(dim=-1)
+
+    logits = logits / max(temperature, 1e-5)
+    if strategy == 'top_k':
+        k = min(top_k, logits.size(-1))
+        kth = torch.topk(logits, k, dim=-1).values[:, -1, None]
+        logits = logits.masked_fill(logits < kth, float('-inf'))
+    elif strategy == 'top_p':
+        sorted_logits, sorted_idx = torch.sort(logits, descending=True, dim=-1)
+        cum = sorted_logits.softmax(dim=-1).cumsum(dim=-1)
+        # Drop tokens once the cumulative probability before them already exceeds top_p
+        drop = cum - sorted_logits.softmax(dim=-1) > top_p
+        sorted_logits = sorted_logits.masked_fill(drop, float('-inf'))
+        logits = torch.full_like(logits, float('-inf')).scatter(-1, sorted_idx, sorted_logits)
+    else:
+        raise ValueError(f"Unknown strategy '{strategy}'")
+    return torch.multinomial(logits.softmax(dim=-1), 1, generator=generator).squeeze(-1)
+
+
+@torch.inference_mode()
+def generate(model, prompts, max_new_tokens, pad_id=0, eos_id=None, use_cache=True, **sampling):
+    """Generate continuations for a batch of prompts (lists of token ids) of any lengths.
+
+    Prompts are left-padded so every sequence's last real token is in the
+    same column. Returns one list of new token ids per prompt, cut at eos_id.
+    """
+    device = model.lm_head.weight.device
+    B = len(prompts)
+    L = max(len(p) for p in prompts)
+    if L + max_new_tokens > model.max_len:
+        raise ValueError(f"prompt + new tokens ({L + max_new_tokens}) exceeds max_len {model.max_len}")
+
+    idx = torch.full((B, L), pad_id, dtype=torch.long, device=device)
+    valid = torch.zeros((B, L), dtype=torch.bool, device=device)
+    for i, p in enumerate(prompts):
+        idx[i, L - len(p):] = torch.tensor(p, dtype=torch.long, device=device)
+        valid[i, L - len(p):] = True
+    position_ids = (valid.long().cumsum(1) - 1).clamp(min=0)
+    next_pos = valid.sum(1)
+
+    cache = model.new_cache(B, L + max_new_tokens) if use_cache else None
+    logits = model(idx, cache=cache, attention_mask=valid, position_ids=position_ids)[:, -1]
+
+    finished = torch.zeros(B, dtype=torch.bool, device=device)
+    generated = []
+    for _ in range(max_new_tokens):
+        tok = sample_next(logits, **sampling)
+        tok = tok.masked_fill(finished, pad_id)
+        generated.append(tok)
+        if eos_id is not None:
+            finished |= tok == eos_id
+            if finished.all():
+                break
+
+        valid = torch.cat([valid, torch.ones((B, 1), dtype=torch.bool, device=device)], dim=1)
+        if use_cache:
+            logits = model(tok[:, None], cache=cache, attention_mask=valid, position_ids=next_pos[:, None])[:, -1]
+        else:
+            # Reference path: re-run the whole sequence every step
+            idx = torch.cat([idx, tok[:, None]], dim=1)
+            position_ids = torch.cat([position_ids, next_pos[:, None]], dim=1)
+            logits = model(idx, attention_mask=valid, position_ids=position_ids)[:, -1]
+        next_pos = next_pos + 1
+
+    out = torch.stack(generated, dim=1).tolist() if generated else [[] for _ in range(B)]
+    if eos_id is not None:
+        out = [seq[:seq.index(eos_id) + 1] if eos_id in seq else seq for seq in out]
+    return out
+
+
+def benchmark(vocab_size=16000, d_model=256, num_heads=8, n_layers=4, batch_size=4, prompt_lens=(16, 32, 48, 64),
+              new_tokens=128, threads=None, seed=0, attn_backend='auto'):
+    """Tokens/sec on CPU for cached vs full-recompute greedy generation."""
+    if threads:
+        torch.set_num_threads(threads)
+    torch.manual_seed(seed)
+    model = GPT(vocab_size, d_model=d_model, num_heads=num_heads, n_layers=n_layers,
+                max_len=max(prompt_lens) + new_tokens, ff_dim=4 * d_model, attn_backend=attn_backend).eval()
+    prompts = [torch.randint(1, vocab_size, (prompt_lens[i % len(prompt_lens)],)).tolist() for i in range(batch_size)]
+
+    results = {}
+    outputs = {}
+    for use_cache in (False, True):
+        generate(model, prompts, 4, use_cache=use_cache)  # warm-up
+        start = time.perf_counter()
+        outputs[use_cache] = generate(model, prompts, new_tokens, use_cache=use_cache)
+        elapsed = time.perf_counter() - start
+        results['cached' if use_cache else 'full_recompute'] = batch_size * new_tokens / elapsed
+
+    print(f"Model: d_model={d_model}, layers={n_layers}, heads={num_heads}, vocab={vocab_size}, "
+          f"threads={torch.get_num_threads()}, attention={model.blocks[0].attn.backend}")
+    print(f"Batch {batch_size}, prompt lengths {list(prompt_lens)}, {new_tokens} new tokens")
+    print(f"  Full recompute: {results['full_recompute']:8.1f} tokens/s")
+    print(f"  KV cache:       {results['cached']:8.1f} tokens/s "
+          f"({results['cached'] / results['full_recompute']:.1f}x)")
+    print(f"  Greedy outputs identical: {outputs[True] == outputs[False]}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Decoder-only GPT with KV-cached generation')
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--new-tokens', type=int, default=128)
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--d-model', type=int, default=256)
+    parser.add_argument('--layers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--attn-backend', choices=['auto', 'sdpa', 'manual'], default='auto')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(d_model=args.d_model, n_layers=args.layers, batch_size=args.batch_size,
+                  new_tokens=args.new_tokens, threads=args.threads, attn_backend=args.attn_backend)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Exact line deduplication for merging large corpora in bounded RAM.
+Replaces the line_hash + seen = set() cells in practise.ipynb, news.ipynb
+and nepali_wikipedia.ipynb, which keep a 32-char MD5 hex string per line.
+
+Each line is reduced to a 64-bit BLAKE2b hash stored in a NumPy
+open-addressing table (8 bytes per slot). When the table would outgrow
+--max-memory-mb it is spilled to a sorted run on disk and new lines are
+checked against the memory-mapped runs; runs are merged externally when
+there are too many of them.
+
+Run: python dedupe_lines.py ne_cleaned.txt ne_corpus_cleaned.txt -o combined_final.txt
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+EMPTY = np.uint64(0)
+LOAD_FACTOR = 0.5
+
+
+def hash_lines(lines):
+    """64-bit hashes of a batch of str lines, as a uint64 array (0 is reserved for empty slots)."""
+    digests = b''.join(hashlib.blake2b(line.encode('utf-8'), digest_size=8).digest() for line in lines)
+    hashes = np.frombuffer(digests, dtype=np.uint64).copy()
+    hashes[hashes == EMPTY] = 1
+    return hashes
+
+
+class HashTable:
+    """Open-addressing uint64 set with vectorized linear probing."""
+
+    def __init__(self, capacity=1 << 20):
+        assert capacity & (capacity - 1) == 0, "capacity must be a power of two"
+        self.table = np.zeros(capacity, dtype=np.uint64)
+        self.mask = np.uint64(capacity - 1)
+        self.count = 0
+
+    @property
+    def capacity(self):
+        return len(self.table)
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes
+
+    def insert(self, hashes):
+        """Insert unique hashes; return a bool mask of the ones that were not present."""
+        table = self.table
+        idx = (hashes & self.mask).astype(np.int64)
+        is_new = np.zeros(len(hashes), dtype=bool)
+        pending = np.arange(len(hashes))
+
+        while pending.size:
+            slots = table[idx[pending]]
+            found = slots == hashes[pending]
+            empty = slots == EMPTY
+
+            # Several pending hashes may probe the same empty slot; the first one claims it
+            claimers = pending[empty]
+            won = np.zeros(len(pending), dtype=bool)
+            if claimers.size:
+                _, first = np.unique(idx[claimers], return_index=True)
+                winners = claimers[first]
+                table[idx[winners]] = hashes[winners]
+                is_new[winners] = True
+                self.count += len(winners)
+                won[np.flatnonzero(empty)[first]] = True
+
+            # Occupied by a different hash: move to the next slot. Losing claimers retry in place.
+            collided = ~found & ~empty
+            idx[pending[collided]] = (idx[pending[collided]] + 1) & (len(table) - 1)
+            pending = pending[~found & ~won]
+
+        return is_new
+
+    def contains(self, hashes):
+        table = self.table
+        idx = (hashes & self.mask).astype(np.int64)
+        present = np.zeros(len(hashes), dtype=bool)
+        pending = np.arange(len(hashes))
+        while pending.size:
+            slots = table[idx[pending]]
+            found = slots == hashes[pending]
+            present[pending[found]] = True
+            keep = ~found & (slots != EMPTY)
+            pending = pending[keep]
+            idx[pending] = (idx[pending] + 1) & (len(table) - 1)
+        return present
+
+    def values(self):
+        return self.table[self.table != EMPTY]
+
+    def grow(self):
+        old = self.values()
+        self.table = np.zeros(self.capacity * 2, dtype=np.uint64)
+        self.mask = np.uint64(self.capacity - 1)
+        self.count = 0
+        self.insert(old)
+
+    def clear(self):
+        self.table[:] = EMPTY
+        self.count = 0
+
+
+def merge_runs(a_path, b_path, out_path, chunk=1 << 22):
+    """Chunked two-way merge of sorted uint64 runs without loading either fully."""
+    a = np.memmap(a_path, dtype=np.uint64, mode='r') if os.path.getsize(a_path) else np.empty(0, np.uint64)
+    b = np.memmap(b_path, dtype=np.uint64, mode='r') if os.path.getsize(b_path) else np.empty(0, np.uint64)
+    i = j = 0
+    with open(out_path, 'wb') as out:
+        while i < len(a) and j < len(b):
+            a_chunk = a[i:i + chunk]
+            b_chunk = b[j:j + chunk]
+            # Everything up to the smaller chunk tail can be emitted safely
+            limit = min(a_chunk[-1], b_chunk[-1])
+            a_take = np.searchsorted(a_chunk, limit, side='right')
+            b_take = np.searchsorted(b_chunk, limit, side='right')
+            merged = np.concatenate([a_chunk[:a_take], b_chunk[:b_take]])
+            merged.sort(kind='stable')
+            out.write(merged.tobytes())
+            i += a_take
+            j += b_take
+        for rest, start in ((a, i), (b, j)):
+            for k in range(start, len(rest), chunk):
+                out.write(np.asarray(rest[k:k + chunk]).tobytes())
+    del a, b
+
+
+class LineDeduplicator:
+    """First-seen-wins dedupe over a stream of lines with a RAM cap."""
+
+    def __init__(self, max_memory_mb=1024, initial_capacity=1 << 20, max_runs=8, tmp_dir=None):
+        self.max_table_bytes = int(max_memory_mb * 1024 * 1024)
+        capacity = initial_capacity
+        while capacity * 8 > self.max_table_bytes and capacity > 1024:
+            capacity //= 2
+        self.table = HashTable(capacity)
+        self.max_runs = max_runs
+        self.tmp_dir = tempfile.mkdtemp(prefix='dedupe_runs_', dir=tmp_dir)
+        self.runs = []  # list of (path, memmap)
+        self.run_counter = 0
+        self.spills = 0
+        self.merges = 0
+
+    def _make_room(self, incoming):
+        while self.table.count + incoming > self.table.capacity * LOAD_FACTOR:
+            if self.table.nbytes * 2 <= self.max_table_bytes:
+                self.table.grow()
+            elif self.table.count:
+                self._spill()
+            else:
+                raise ValueError("batch_size is too large for max_memory_mb; lower the batch size")
+
+    def _new_run_path(self):
+        self.run_counter += 1
+        return os.path.join(self.tmp_dir, f'run_{self.run_counter:05d}.u64')
+
+    def _spill(self):
+        """Write the table as a sorted run and start over with an empty table."""
+        values = np.sort(self.table.values())
+        path = self._new_run_path()
+        values.tofile(path)
+        self.runs.append((path, np.memmap(path, dtype=np.uint64, mode='r')))
+        self.table.clear()
+        self.spills += 1
+
+        # External merge keeps the number of runs (and lookups per batch) bounded
+        while len(self.runs) > self.max_runs:
+            self.runs.sort(key=lambda run: len(run[1]))
+            (a_path, a), (b_path, b) = self.runs[:2]
+            out_path = self._new_run_path()
+            self.runs = self.runs[2:]
+            del a, b
+            merge_runs(a_path, b_path, out_path)
+            os.remove(a_path)
+            os.remove(b_path)
+            self.runs.append((out_path, np.memmap(out_path, dtype=np.uint64, mode='r')))
+            self.merges += 1
+
+    def _in_runs(self, sorted_hashes):
+        present = np.zeros(len(sorted_hashes), dtype=bool)
+        for _, run in self.runs:
+            if not len(run):
+                continue
+            pos = np.searchsorted(run, sorted_hashes)
+            hit = pos < len(run)
+            hit[hit] = run[pos[hit]] == sorted_hashes[hit]
+            present |= hit
+        return present
+
+    def filter_batch(self, lines):
+        """Return the indices (in order) of lines in this batch seen for the first time."""
+        if not lines:
+            return np.empty(0, dtype=np.int64)
+        hashes = hash_lines(lines)
+        # np.unique gives sorted candidates (good locality for run lookups) and first positions
+        candidates, first_pos = np.unique(hashes, return_index=True)
+
+        # Spill before the run lookup so hashes moved out of the table are still checked
+        self._make_room(len(candidates))
+        fresh = ~self._in_runs(candidates) if self.runs else np.ones(len(candidates), dtype=bool)
+        candidates = candidates[fresh]
+        first_pos = first_pos[fresh]
+
+        is_new = self.table.insert(candidates)
+        return np.sort(first_pos[is_new])
+
+    def close(self):
+        self.runs = []
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def dedupe_files(input_files, output_file, min_length=5, max_memory_mb=1024, batch_size=65536,
+                 tmp_dir=None, verbose=True):
+    """Merge input_files into output_file keeping the first occurrence of each line."""
+    dedup = LineDeduplicator(max_memory_mb=max_memory_mb, tmp_dir=tmp_dir)
+    stats = {'lines_seen': 0, 'too_short': 0, 'unique': 0, 'duplicates': 0}
+    start_time = time.time()
+
+    def flush(batch, out):
+        keep = dedup.filter_batch(batch)
+        out.write(''.join(batch[i] + '\n' for i in keep))
+        stats['unique'] += len(keep)
+        stats['duplicates'] += len(batch) - len(keep)
+
+    try:
+        with open(output_file, 'w', encoding='utf-8') as out:
+            for path in input_files:
+                if verbose:
+                    print(f"\nProcessing {path}...")
+                batch = []
+                with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                    for line in f:
+                        line = line.strip()
+                        stats['lines_seen'] += 1
+                        if len(line) < min_length:
+                            stats['too_short'] += 1
+                            continue
+                        batch.append(line)
+                        if len(batch) >= batch_size:
+                            flush(batch, out)
+                            batch = []
+                if batch:
+                    flush(batch, out)
+                if verbose:
+                    print(f"  Unique so far: {stats['unique']:,} | Duplicates: {stats['duplicates']:,}")
+    finally:
+        stats['spilled_runs'] = dedup.spills
+        stats['run_merges'] = dedup.merges
+        dedup.close()
+
+    stats['seconds'] = time.time() - start_time
+    if verbose:
+        print("\n✓ Combined + deduplicated successfully!")
+        print(f"Total lines seen: {stats['lines_seen']:,}")
+        print(f"Too short (<{min_length} chars): {stats['too_short']:,}")
+        print(f"Unique lines written: {stats['unique']:,}")
+        print(f"Duplicates removed: {stats['duplicates']:,}")
+        print(f"Spilled runs: {stats['spilled_runs']} (merges: {stats['run_merges']})")
+        print(f"Time: {stats['seconds']:.1f}s")
+        print(f"Output saved to: {output_file}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory-bounded exact line dedupe across files')
+    parser.add_argument('input_files', nargs='+', help='processed in order; first occurrence wins')
+    parser.add_argument('-o', '--output', required=True)
+    parser.add_argument('--min-length', type=int, default=5)
+    parser.add_argument('--max-memory-mb', type=float, default=1024, help='hash table budget before spilling')
+    parser.add_argument('--batch-size', type=int, default=65536)
+    parser.add_argument('--tmp-dir', default=None)
+    args = parser.parse_args()
+
+    dedupe_files(args.input_files, args.output, min_length=args.min_length,
+                 max_memory_mb=args.max_memory_mb, batch_size=args.batch_size, tmp_dir=args.tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+CPU serving variants of the review classifier: dynamic int8 quantization,
+TorchScript and (optionally) ONNX, validated against the fp32 model.
+
+Dynamic quantization stores every nn.Linear (QKV, output projections, the
+d_model x ff_dim MLP, the rating head) as int8 and quantizes activations
+on the fly, so no calibration data is needed. Every variant is scored on
+the same held-out reviews and compared with fp32 on accuracy, agreement
+and max probability drift, then timed for single-review latency and
+bucketed batch throughput.
+
+Run: python export_model.py --checkpoint review_model.pt --tokenizer ne_spm.model \\
+         --heldout heldout_reviews.csv --out-prefix export/review_model --onnx
+Then score with: python score_reviews.py ... --checkpoint export/review_model_int8.ts
+"""
+
+import argparse
+import copy
+import json
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from review_model import PLACEHOLDER_TEXTS, RATINGS, ScriptedClassifier, pad_batch, save_scripted
+from score_reviews import iter_review_chunks, load_model, predict_chunk
+
+RATING_COLUMNS = ('review_rating', 'Review Rating', 'rating')
+
+
+def parse_rating(value):
+    """'5', '5.0' or 5 -> class index 4; None when the rating is missing or out of range."""
+    try:
+        rating = int(round(float(value)))
+    except (TypeError, ValueError):
+        return None
+    return RATINGS.index(rating) if rating in RATINGS else None
+
+
+def load_heldout(paths, limit=2000, text_column=None):
+    """(texts, labels) for up to limit reviews that have both text and a 1-5 rating."""
+    texts, labels = [], []
+    for _, _, rows in iter_review_chunks(paths, 4096, text_column):
+        for row in rows:
+            label = parse_rating(next((row[c] for c in RATING_COLUMNS if row.get(c)), None))
+            if label is None or row['_text'] in PLACEHOLDER_TEXTS:
+                continue
+            texts.append(row['_text'])
+            labels.append(label)
+            if len(texts) >= limit:
+                return texts, np.asarray(labels, dtype=np.int64)
+    return texts, np.asarray(labels, dtype=np.int64)
+
+
+def quantize_int8(model):
+    """Copy of model with every nn.Linear replaced by a dynamically quantized int8 Linear."""
+    return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {nn.Linear}, dtype=torch.qint8)
+
+
+def trace(model, example):
+    with torch.inference_mode(False), torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(model, example).eval())
+
+
+def export_onnx(model, example, path):
+    torch.onnx.export(model, example, path, input_names=['idx', 'lengths'], output_names=['logits'],
+                      dynamic_axes={'idx': {0: 'batch', 1: 'seq'}, 'lengths': {0: 'batch'}, 'logits': {0: 'batch'}})
+
+
+def onnx_runner(path):
+    """Callable (idx, lengths) -> logits backed by onnxruntime."""
+    import onnxruntime as ort
+    session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+
+    def run(idx, lengths):
+        logits, = session.run(None, {'idx': idx.numpy(), 'lengths': lengths.numpy()})
+        return torch.from_numpy(logits)
+    return run
+
+
+def evaluate(model, tokenizer, texts, labels, reference=None, max_batch_size=64, max_tokens=8192):
+    """Accuracy and throughput on texts; agreement/drift against reference probs when given."""
+    start = time.perf_counter()
+    probs, _, _ = predict_chunk(model, tokenizer, texts, max_batch_size, max_tokens)
+    elapsed = time.perf_counter() - start
+    pred = probs.argmax(axis=1)
+    result = {
+        'accuracy': float((pred == labels).mean()) if len(labels) else None,
+        'reviews_per_second': len(texts) / max(elapsed, 1e-9),
+    }
+    if reference is not None:
+        result['agreement'] = float((pred == reference.argmax(axis=1)).mean())
+        result['max_prob_diff'] = float(np.abs(probs - reference).max())
+    return result, probs
+
+
+def latency(model, tokenizer, texts, n=100):
+    """p50/p95 milliseconds for scoring one review at a time."""
+    times = []
+    for text in texts[:n]:
+        idx, lengths = pad_batch([tokenizer.encode(text)], model.max_len, model.pad_id)
+        start = time.perf_counter()
+        model(idx, lengths)
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.percentile(times, 50)), float(np.percentile(times, 95))
+
+
+def file_mb(path):
+    return os.path.getsize(path) / 2**20 if path and os.path.exists(path) else None
+
+
+def export_and_benchmark(checkpoint, tokenizer_path, heldout, out_prefix, onnx=False, threads=None, limit=2000,
+                         max_batch_size=64, max_tokens=8192, random_init=False, verbose=True):
+    """Build fp32/int8 (+TorchScript, +ONNX) variants, save them and return a report per variant."""
+    if threads:
+        torch.set_num_threads(threads)
+    os.makedirs(os.path.dirname(out_prefix) or '.', exist_ok=True)
+    model, tokenizer = load_model(checkpoint, tokenizer_path, random_init=random_init)
+    config = model.config
+    texts, labels = load_heldout(heldout, limit)
+    if not texts:
+        raise ValueError("Held-out set has no reviews with both text and a 1-5 rating")
+    if verbose:
+        print(f"Held-out reviews: {len(texts):,}, threads: {torch.get_num_threads()}")
+
+    example = pad_batch([tokenizer.encode(t) for t in texts[:4]], model.max_len, model.pad_id)
+    int8 = quantize_int8(model).eval()
+    fp32_path = f"{out_prefix}_fp32.pt"
+    model.save(fp32_path)
+    variants = {'fp32': (model, fp32_path), 'int8': (int8, None)}
+
+    for name, base in (('fp32_ts', model), ('int8_ts', int8)):
+        path = f"{out_prefix}_{name[:-3]}.ts"
+        try:
+            scripted = trace(base, example)
+            save_scripted(scripted, config, path)
+            variants[name] = (ScriptedClassifier(scripted, config), path)
+        except Exception as e:
+            print(f"⚠️ TorchScript export of {name[:-3]} failed: {e}")
+
+    if onnx:
+        path = f"{out_prefix}.onnx"
+        try:
+            export_onnx(model, example, path)
+            variants['onnx'] = (ScriptedClassifier(onnx_runner(path), config), path)
+        except ImportError as e:
+            print(f"⚠️ ONNX variant skipped ({e}); pip install onnx onnxruntime")
+        except Exception as e:
+            print(f"⚠️ ONNX export failed: {e}")
+
+    report = {}
+    reference = None
+    with torch.inference_mode():
+        for name, (variant, path) in variants.items():
+            result, probs = evaluate(variant, tokenizer, texts, labels, reference, max_batch_size, max_tokens)
+            if reference is None:
+                reference = probs
+            result['latency_p50_ms'], result['latency_p95_ms'] = latency(variant, tokenizer, texts)
+            result['path'] = path
+            result['size_mb'] = file_mb(path)
+            report[name] = result
+
+    with open(f"{out_prefix}_report.json", 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    if verbose:
+        print(f"\n{'variant':<9} {'accuracy':>9} {'agree':>7} {'max dprob':>10} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'reviews/s':>10} {'MB':>7}")
+        for name, r in report.items():
+            size = f"{r['size_mb']:.1f}" if r['size_mb'] is not None else '-'
+            print(f"{name:<9} {r['accuracy']:>9.4f} {r.get('agreement', 1.0):>7.4f} "
+                  f"{r.get('max_prob_diff', 0.0):>10.2e} {r['latency_p50_ms']:>8.2f} {r['latency_p95_ms']:>8.2f} "
+                  f"{r['reviews_per_second']:>10,.0f} {size:>7}")
+        print(f"\nReport saved: {out_prefix}_report.json")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantize/export the review classifier and compare variants')
+    parser.add_argument('--checkpoint', default='review_model.pt')
+    parser.add_argument('--tokenizer', default='ne_spm.model')
+    parser.add_argument('--heldout', nargs='+', required=True, help='review CSVs with text and rating columns')
+    parser.add_argument('--out-prefix', default='export/review_model')
+    parser.add_argument('--onnx', action='store_true', help='also export and time an ONNX model (needs onnxruntime)')
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--limit', type=int, default=2000, help='held-out reviews to use')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--max-tokens', type=int, default=8192)
+    parser.add_argument('--random-init', action='store_true', help='untrained model, for speed tests only')
+    args = parser.parse_args()
+
+    export_and_benchmark(args.checkpoint, args.tokenizer, args.heldout, args.out_prefix, onnx=args.onnx,
+                         threads=args.threads, limit=args.limit, max_batch_size=args.batch_size,
+                         max_tokens=args.max_tokens, random_init=args.random_init)
+
+
+if __name__ == "__main__":
+    main()
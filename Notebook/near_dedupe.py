@@ -0,0 +1,292 @@
+"""
+MinHash-LSH near-duplicate detection for corpus lines and scraped reviews.
+
+Exact hashing (dedupe_lines.py) only removes byte-identical lines. This finds
+near-copies such as news boilerplate with a changed date, copy-pasted seller
+replies or reviews that differ only in punctuation.
+
+Documents are shingled on Devanagari aksharas (a consonant keeps its
+matras, nukta and virama conjuncts) rather than raw code points, MinHash
+signatures are computed in NumPy across a process pool, and LSH band keys
+are grouped by sorting so only bands * 8 bytes per document stay in memory.
+
+Run: python near_dedupe.py news_cleaned.txt -o news_neardedup.txt --clusters news_clusters.tsv
+     python near_dedupe.py ../daraz_product_review/output/daraz_products_*.csv \\
+         --column review_text -o reviews_neardedup.csv
+"""
+
+import argparse
+import csv
+import os
+import re
+import time
+import unicodedata
+import zlib
+from multiprocessing import Pool
+
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+MAX_SHINGLES_PER_STEP = 32768  # 128 perms x 32768 x 8 bytes = 32 MB scratch per worker
+
+# Empty reviews and the spider's placeholder are not text; each stays its own cluster
+PLACEHOLDER_TEXTS = {'', 'No review text'}
+PUNCTUATION = re.compile(r'[\s.,!?;:()\[\]{}\-\'"/\\।॥|…“”‘’]+')
+VIRAMA = '\u094d'
+
+
+def normalize(text):
+    """NFC, lowercase, punctuation folded to single spaces."""
+    text = unicodedata.normalize('NFC', text).lower()
+    return PUNCTUATION.sub(' ', text).strip()
+
+
+def aksharas(text):
+    """Split text into units where combining marks stay attached to their base.
+
+    A virama also pulls the following consonant into the same unit, so
+    conjuncts like क्ष are one unit and a shingle never starts on a matra.
+    """
+    units = []
+    for ch in text:
+        if units and (unicodedata.category(ch) in ('Mn', 'Mc') or units[-1].endswith(VIRAMA)):
+            units[-1] += ch
+        else:
+            units.append(ch)
+    return units
+
+
+def shingle_hashes(text, k):
+    """32-bit CRC of every k-akshara shingle of the normalized text."""
+    units = aksharas(normalize(text))
+    if len(units) <= k:
+        shingles = {''.join(units)}
+    else:
+        shingles = {''.join(units[i:i + k]) for i in range(len(units) - k + 1)}
+    return [zlib.crc32(s.encode('utf-8')) for s in shingles]
+
+
+def make_permutations(num_perm, seed=1):
+    rng = np.random.RandomState(seed)
+    # a < 2^31 and x < 2^32 keep a * x + b inside uint64 before the modulo
+    a = rng.randint(1, 1 << 31, size=num_perm, dtype=np.int64).astype(np.uint64)
+    b = rng.randint(0, 1 << 31, size=num_perm, dtype=np.int64).astype(np.uint64)
+    return a, b
+
+
+def is_blank(text):
+    return text.strip() in PLACEHOLDER_TEXTS or not normalize(text)
+
+
+def band_keys_for_batch(args):
+    """Worker: MinHash band keys (one uint64 per band) plus a blank flag for each text in a batch.
+
+    Blank documents (empty, punctuation-only or placeholder) would all
+    shingle to the same empty string, so they are flagged instead of matched.
+    """
+    texts, k, num_perm, bands, seed = args
+    a, b = make_permutations(num_perm, seed)
+    rows = num_perm // bands
+
+    blank = np.fromiter((is_blank(text) for text in texts), dtype=bool, count=len(texts))
+    per_doc = [shingle_hashes(text, k) for text in texts]
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+
+    # Groups of documents are permuted together, capped so the (num_perm, shingles) matrix stays small
+    start = 0
+    while start < len(per_doc):
+        end, total = start, 0
+        while end < len(per_doc) and (end == start or total + len(per_doc[end]) <= MAX_SHINGLES_PER_STEP):
+            total += len(per_doc[end])
+            end += 1
+        group = per_doc[start:end]
+        lengths = np.array([len(h) for h in group], dtype=np.int64)
+        flat = np.fromiter((h for hs in group for h in hs), dtype=np.uint64, count=total)
+        permuted = ((a[:, None] * flat[None, :] + b[:, None]) % MERSENNE_PRIME) & MAX_HASH
+        offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        signatures[start:end] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        start = end
+
+    # Fold each band's rows into a single key with random odd multipliers (wrapping is fine)
+    mult = np.random.RandomState(seed + 1).randint(1, 1 << 62, size=rows, dtype=np.int64).astype(np.uint64) | 1
+    banded = signatures[:, :bands * rows].reshape(len(texts), bands, rows)
+    with np.errstate(over='ignore'):
+        keys = (banded * mult).sum(axis=2, dtype=np.uint64)
+    return keys, blank
+
+
+class UnionFind:
+    """Array-backed union-find; the smallest document id is always the root."""
+
+    def __init__(self, n):
+        self.parent = np.arange(n, dtype=np.int64)
+
+    def find(self, x):
+        parent = self.parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, x, y):
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            if rx < ry:
+                self.parent[ry] = rx
+            else:
+                self.parent[rx] = ry
+
+    def roots(self):
+        # Pointer jumping until every node points straight at its root
+        parent = self.parent.copy()
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                return parent
+            parent = grand
+
+
+def iter_documents(paths, column=None):
+    """Yield document text from text files (one per line) or CSV files (one column)."""
+    for path in paths:
+        if column:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                for row in csv.DictReader(f):
+                    yield row.get(column) or ''
+        else:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                for line in f:
+                    yield line.rstrip('\n')
+
+
+def iter_batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def find_clusters(paths, column=None, k=4, num_perm=128, bands=16, workers=None, batch_size=512,
+                  seed=1, verbose=True):
+    """Return a cluster id per document (the id of the first document in its cluster).
+
+    Blank documents never join a cluster, so each one is kept as a singleton.
+    """
+    if num_perm % bands:
+        raise ValueError("num_perm must be divisible by bands")
+    workers = workers or os.cpu_count() or 1
+    tasks = ((batch, k, num_perm, bands, seed) for batch in iter_batches(iter_documents(paths, column), batch_size))
+
+    start_time = time.time()
+    key_batches, blank_batches = [], []
+    if workers == 1:
+        for keys, blank in map(band_keys_for_batch, tasks):
+            key_batches.append(keys)
+            blank_batches.append(blank)
+    else:
+        with Pool(workers) as pool:
+            for keys, blank in pool.imap(band_keys_for_batch, tasks):
+                key_batches.append(keys)
+                blank_batches.append(blank)
+    keys = np.concatenate(key_batches) if key_batches else np.empty((0, bands), dtype=np.uint64)
+    blank = np.concatenate(blank_batches) if blank_batches else np.empty(0, dtype=bool)
+    n_docs = len(keys)
+    if verbose:
+        print(f"  Signatures for {n_docs:,} documents in {time.time() - start_time:.1f}s")
+
+    # Documents sharing any band key are candidates; sorting each band groups them without dicts
+    uf = UnionFind(n_docs)
+    candidates = np.flatnonzero(~blank)
+    for band in range(bands):
+        order = candidates[np.argsort(keys[candidates, band], kind='stable')]
+        sorted_keys = keys[order, band]
+        same = np.flatnonzero(sorted_keys[1:] == sorted_keys[:-1])
+        for i in same:
+            uf.union(order[i], order[i + 1])
+    return uf.roots()
+
+
+def near_dedupe(paths, output_file, clusters_file=None, column=None, **kwargs):
+    """Write the first document of every near-duplicate cluster to output_file."""
+    verbose = kwargs.get('verbose', True)
+    if verbose:
+        print(f"🔍 Finding near-duplicates in {len(paths)} file(s)...")
+    cluster_ids = find_clusters(paths, column=column, **kwargs)
+    keep = cluster_ids == np.arange(len(cluster_ids))
+
+    if column:
+        # Union of all headers, so older spider CSVs can be mixed with ones that have extra columns
+        fieldnames = []
+        for path in paths:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                for name in csv.DictReader(f).fieldnames or ():
+                    if name not in fieldnames:
+                        fieldnames.append(name)
+        with open(output_file, 'w', encoding='utf-8', newline='') as out:
+            writer = csv.DictWriter(out, fieldnames=fieldnames + ['near_dup_cluster'], restval='')
+            writer.writeheader()
+            doc = 0
+            for path in paths:
+                with open(path, 'r', encoding='utf-8', newline='') as f:
+                    reader = csv.DictReader(f)
+                    for row in reader:
+                        if keep[doc]:
+                            row['near_dup_cluster'] = int(cluster_ids[doc])
+                            writer.writerow(row)
+                        doc += 1
+    else:
+        with open(output_file, 'w', encoding='utf-8') as out:
+            for doc, text in enumerate(iter_documents(paths)):
+                if keep[doc]:
+                    out.write(text + '\n')
+
+    if clusters_file:
+        with open(clusters_file, 'w', encoding='utf-8') as out:
+            out.write("doc_id\tcluster_id\n")
+            for doc, cluster in enumerate(cluster_ids):
+                out.write(f"{doc}\t{cluster}\n")
+
+    stats = {
+        'documents': len(cluster_ids),
+        'kept': int(keep.sum()),
+        'removed': int((~keep).sum()),
+        'clusters_with_duplicates': int(len(np.unique(cluster_ids[~keep]))),
+    }
+    if verbose:
+        print("\n✓ Near-duplicate filtering complete!")
+        print(f"Documents: {stats['documents']:,}")
+        print(f"Kept: {stats['kept']:,}")
+        print(f"Removed as near-duplicates: {stats['removed']:,}")
+        print(f"Clusters with duplicates: {stats['clusters_with_duplicates']:,}")
+        print(f"Output saved to: {output_file}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MinHash-LSH near-duplicate filter for text and review CSVs')
+    parser.add_argument('input_files', nargs='+')
+    parser.add_argument('-o', '--output', required=True)
+    parser.add_argument('--clusters', default=None, help='optional TSV of doc_id -> cluster_id')
+    parser.add_argument('--column', default=None, help='CSV column to compare (e.g. review_text); '
+                                                        'inputs are plain text lines if omitted')
+    parser.add_argument('--shingle', type=int, default=4, help='aksharas per shingle')
+    parser.add_argument('--num-perm', type=int, default=128)
+    parser.add_argument('--bands', type=int, default=16, help='more bands = lower similarity threshold')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=512)
+    args = parser.parse_args()
+
+    near_dedupe(args.input_files, args.output, clusters_file=args.clusters, column=args.column,
+                k=args.shingle, num_perm=args.num_perm, bands=args.bands, workers=args.workers,
+                batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
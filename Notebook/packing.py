@@ -0,0 +1,390 @@
+"""
+Training batches from token shards without wasting slots on padding.
+
+Reviews and news lines are mostly far shorter than seq_len, so padding
+each one to the longest in the batch leaves most of every batch as pad
+tokens the model still has to run. Two alternatives, both built on the
+document offsets that token_shards.py stores in each .idx.npy:
+
+- PackedDataset concatenates documents (in a fresh shuffled order each
+  epoch) and cuts the stream into fixed seq_len windows. Every token comes
+  with a document id and a position that restarts at 0 for each document,
+  so GPT(document_ids=...) keeps attention inside each document and
+  targets never cross a boundary.
+- LengthBucketSampler keeps one document per row but groups documents of
+  similar length under a token budget, reusing score_reviews.bucket_batches.
+
+utilization() is the share of batch slots that are trained targets;
+benchmark() trains a small GPT with each strategy and compares real
+(target) tokens per second.
+
+Run: python packing.py stats data/ne_tokens.json --seq-len 256
+     python packing.py benchmark data/ne_tokens.json --seq-len 256 --steps 20
+Use: from packing import PackedDataset, collate_packed, lm_loss
+"""
+
+import argparse
+import functools
+import json
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset, RandomSampler, BatchSampler, Sampler
+
+from decoder_only import GPT
+from score_reviews import bucket_batches
+
+IGNORE_INDEX = -100  # label for pad slots and cross-document targets
+STRATEGIES = ('padded', 'bucketed', 'packed')
+
+
+class DocumentShards:
+    """(shard, start, length) of every document in a token shard manifest, with lazy memmaps."""
+
+    def __init__(self, manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.base_dir = os.path.dirname(manifest_path) or '.'
+        self.dtype = np.dtype(self.manifest['dtype'])
+        self.eos_id = self.manifest['eos_id']
+
+        shard_ids, starts, lengths = [], [], []
+        for i, shard in enumerate(self.manifest['shards']):
+            offsets = np.load(os.path.join(self.base_dir, shard['idx']))
+            shard_ids.append(np.full(len(offsets) - 1, i, dtype=np.int32))
+            starts.append(offsets[:-1])
+            lengths.append(np.diff(offsets))
+        self.shard_ids = np.concatenate(shard_ids) if shard_ids else np.zeros(0, dtype=np.int32)
+        self.starts = np.concatenate(starts) if starts else np.zeros(0, dtype=np.int64)
+        self.lengths = np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int64)
+        self._shards = None
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getstate__(self):
+        # Memmaps are reopened in each DataLoader worker
+        state = self.__dict__.copy()
+        state['_shards'] = None
+        return state
+
+    def tokens(self, doc, begin=0, end=None):
+        """uint16 view of document doc's tokens [begin:end]."""
+        if self._shards is None:
+            self._shards = [np.memmap(os.path.join(self.base_dir, s['bin']), dtype=self.dtype, mode='r')
+                            for s in self.manifest['shards']]
+        start = int(self.starts[doc])
+        length = int(self.lengths[doc])
+        end = length if end is None else min(end, length)
+        return self._shards[self.shard_ids[doc]][start + begin:start + end]
+
+
+class PackedDataset(Dataset):
+    """Fixed seq_len windows over documents concatenated in a per-epoch shuffled order.
+
+    Item i is a dict of int64 tensors of length seq_len: input_ids,
+    labels (next token, IGNORE_INDEX where it belongs to another document),
+    position_ids (restarting at 0 for each document and at the window
+    start) and document_ids (0, 1, ... per document within the window).
+    The order depends only on (seed, epoch), so workers need no coordination.
+    """
+
+    def __init__(self, shards, seq_len, seed=0, shuffle=True):
+        self.shards = shards if isinstance(shards, DocumentShards) else DocumentShards(shards)
+        self.seq_len = seq_len
+        self.seed = seed
+        self.shuffle = shuffle
+        self.epoch = 0
+        total = int(self.shards.lengths.sum())
+        if total <= seq_len:
+            raise ValueError(f"Corpus has only {total} tokens, need more than seq_len = {seq_len}")
+        self.num_samples = (total - 1) // seq_len
+        self._plan_epoch = None
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _plan(self):
+        if self._plan_epoch != self.epoch:
+            if self.shuffle:
+                self.order = np.random.default_rng((self.seed, self.epoch)).permutation(len(self.shards))
+            else:
+                self.order = np.arange(len(self.shards))
+            self.ends = np.cumsum(self.shards.lengths[self.order])
+            self._plan_epoch = self.epoch
+
+    def __len__(self):
+        return self.num_samples
+
+    def __getitem__(self, i):
+        self._plan()
+        # seq_len + 1 tokens so the last input position still has a target
+        start = i * self.seq_len
+        stop = start + self.seq_len + 1
+        tokens = np.empty(self.seq_len + 1, dtype=np.int64)
+        doc_ids = np.empty(self.seq_len + 1, dtype=np.int64)
+        positions = np.empty(self.seq_len + 1, dtype=np.int64)
+
+        k = int(np.searchsorted(self.ends, start, side='right'))
+        pos = start
+        piece = 0
+        while pos < stop:
+            doc = self.order[k]
+            doc_start = int(self.ends[k] - self.shards.lengths[doc])
+            begin = pos - doc_start
+            end = min(int(self.ends[k]), stop) - doc_start
+            n = end - begin
+            out = pos - start
+            tokens[out:out + n] = self.shards.tokens(doc, begin, end)
+            doc_ids[out:out + n] = piece
+            positions[out:out + n] = np.arange(n)
+            pos += n
+            piece += 1
+            k += 1
+
+        labels = tokens[1:].copy()
+        labels[doc_ids[1:] != doc_ids[:-1]] = IGNORE_INDEX
+        return {
+            'input_ids': torch.from_numpy(tokens[:-1]),
+            'labels': torch.from_numpy(labels),
+            'position_ids': torch.from_numpy(positions[:-1]),
+            'document_ids': torch.from_numpy(doc_ids[:-1]),
+        }
+
+
+class DocumentDataset(Dataset):
+    """One document per item, cut to seq_len + 1 tokens (input plus shifted target)."""
+
+    def __init__(self, shards, seq_len):
+        self.shards = shards if isinstance(shards, DocumentShards) else DocumentShards(shards)
+        self.seq_len = seq_len
+        self.lengths = np.minimum(self.shards.lengths, seq_len + 1)
+
+    def __len__(self):
+        return len(self.shards)
+
+    def __getitem__(self, i):
+        return torch.from_numpy(self.shards.tokens(i, 0, self.seq_len + 1).astype(np.int64))
+
+
+class LengthBucketSampler(Sampler):
+    """Batches of similar-length documents whose padded size stays under max_tokens.
+
+    Each epoch shuffles the documents, sorts them by length within pools of
+    pool_batches * max_batch_size, cuts each pool with bucket_batches and
+    shuffles the batch order, so batches stay tight but not length-ordered.
+    """
+
+    def __init__(self, lengths, max_tokens, max_batch_size=64, pool_batches=100, seed=0):
+        self.lengths = np.asarray(lengths)
+        self.max_tokens = max_tokens
+        self.max_batch_size = max_batch_size
+        self.pool_size = pool_batches * max_batch_size
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _batches(self):
+        rng = np.random.default_rng((self.seed, self.epoch))
+        order = rng.permutation(len(self.lengths))
+        batches = []
+        for p in range(0, len(order), self.pool_size):
+            pool = order[p:p + self.pool_size]
+            # Widths are input lengths, one less than the stored seq_len + 1 tokens
+            for batch in bucket_batches(self.lengths[pool] - 1, self.max_batch_size, self.max_tokens):
+                batches.append(pool[batch].tolist())
+        return [batches[j] for j in rng.permutation(len(batches))]
+
+    def __iter__(self):
+        return iter(self._batches())
+
+    def __len__(self):
+        return len(self._batches())
+
+
+def collate_packed(items):
+    return {key: torch.stack([item[key] for item in items]) for key in items[0]}
+
+
+def collate_padded(items, pad_id=0):
+    """Right-pad documents to the longest in the batch.
+
+    No document_ids: with right padding the causal mask already keeps real
+    tokens from seeing pads, so the model can take its is_causal fast path.
+    """
+    width = max(len(t) for t in items) - 1
+    input_ids = torch.full((len(items), width), pad_id, dtype=torch.long)
+    labels = torch.full((len(items), width), IGNORE_INDEX, dtype=torch.long)
+    for row, tokens in enumerate(items):
+        n = len(tokens) - 1
+        input_ids[row, :n] = tokens[:-1]
+        labels[row, :n] = tokens[1:]
+    return {'input_ids': input_ids, 'labels': labels}
+
+
+def utilization(batch):
+    """(target tokens, batch slots) for one batch; their ratio is the tokens-per-batch utilization."""
+    labels = batch['labels']
+    return int((labels != IGNORE_INDEX).sum()), labels.numel()
+
+
+def lm_loss(model, batch):
+    logits = model(batch['input_ids'], position_ids=batch.get('position_ids'),
+                   document_ids=batch.get('document_ids'))
+    return F.cross_entropy(logits.flatten(0, 1), batch['labels'].flatten(), ignore_index=IGNORE_INDEX)
+
+
+def make_loader(strategy, shards, seq_len, batch_size, seed=0, num_workers=0, pad_id=0):
+    """DataLoader yielding batch dicts for 'padded', 'bucketed' or 'packed' training."""
+    if strategy == 'packed':
+        dataset = PackedDataset(shards, seq_len, seed=seed)
+        generator = torch.Generator().manual_seed(seed)
+        return DataLoader(dataset, batch_size=batch_size, shuffle=True, generator=generator,
+                          collate_fn=collate_packed, num_workers=num_workers, drop_last=True)
+
+    dataset = DocumentDataset(shards, seq_len)
+    collate = functools.partial(collate_padded, pad_id=pad_id)
+    if strategy == 'bucketed':
+        # Same padded-token budget per batch as a full packed batch
+        sampler = LengthBucketSampler(dataset.lengths, batch_size * seq_len, max_batch_size=batch_size * 8,
+                                      seed=seed)
+    elif strategy == 'padded':
+        generator = torch.Generator().manual_seed(seed)
+        sampler = BatchSampler(RandomSampler(dataset, generator=generator), batch_size, drop_last=True)
+    else:
+        raise ValueError(f"Unknown strategy '{strategy}', expected one of {STRATEGIES}")
+    return DataLoader(dataset, batch_sampler=sampler, collate_fn=collate, num_workers=num_workers)
+
+
+def loader_stats(loader, max_batches=None):
+    """Utilization over (up to max_batches of) a loader without running a model."""
+    targets = slots = batches = 0
+    for batch in loader:
+        t, s = utilization(batch)
+        targets += t
+        slots += s
+        batches += 1
+        if max_batches and batches >= max_batches:
+            break
+    return {'batches': batches, 'target_tokens': targets, 'slots': slots,
+            'utilization': targets / max(slots, 1), 'tokens_per_batch': targets / max(batches, 1)}
+
+
+def check_packing(model, dataset, samples=4, atol=1e-4):
+    """Max |logit difference| between documents inside packed windows and the same pieces run alone."""
+    worst = 0.0
+    with torch.no_grad():
+        for i in range(min(samples, len(dataset))):
+            item = dataset[i]
+            packed = model(item['input_ids'][None], position_ids=item['position_ids'][None],
+                           document_ids=item['document_ids'][None])[0]
+            for doc in item['document_ids'].unique():
+                where = (item['document_ids'] == doc).nonzero().squeeze(1)
+                alone = model(item['input_ids'][where][None])[0]
+                worst = max(worst, float((packed[where] - alone).abs().max()))
+    if worst > atol:
+        raise AssertionError(f"Packed and per-document logits differ by {worst:.2e}")
+    return worst
+
+
+def benchmark(manifest_path, seq_len=256, batch_size=16, steps=20, warmup=2, strategies=STRATEGIES,
+              d_model=256, num_heads=8, n_layers=4, threads=None, seed=0, attn_backend='auto', num_workers=0):
+    """Train a small GPT for a few steps per strategy and compare target tokens/sec on CPU."""
+    if threads:
+        torch.set_num_threads(threads)
+    shards = DocumentShards(manifest_path)
+    vocab_size = shards.manifest['vocab_size']
+    lengths = shards.lengths
+    print(f"Documents: {len(shards):,}, tokens: {int(lengths.sum()):,}, "
+          f"median length {int(np.median(lengths))}, >{seq_len + 1}: {(lengths > seq_len + 1).mean():.1%}")
+    print(f"Model: d_model={d_model}, layers={n_layers}, seq_len={seq_len}, batch={batch_size}, "
+          f"threads={torch.get_num_threads()}")
+
+    results = {}
+    for strategy in strategies:
+        torch.manual_seed(seed)
+        model = GPT(vocab_size, d_model=d_model, num_heads=num_heads, n_layers=n_layers, max_len=seq_len,
+                    ff_dim=4 * d_model, attn_backend=attn_backend)
+        optimizer = torch.optim.AdamW(model.parameters(), lr=3e-4)
+        loader = iter(make_loader(strategy, shards, seq_len, batch_size, seed, num_workers))
+        targets = slots = 0
+        elapsed = 0.0
+        for step in range(warmup + steps):
+            batch = next(loader, None)
+            if batch is None:
+                break
+            start = time.perf_counter()
+            loss = lm_loss(model, batch)
+            optimizer.zero_grad(set_to_none=True)
+            loss.backward()
+            optimizer.step()
+            if step >= warmup:
+                elapsed += time.perf_counter() - start
+                t, s = utilization(batch)
+                targets += t
+                slots += s
+        measured = max(step + 1 - warmup, 0)
+        results[strategy] = {
+            'steps': measured,
+            'utilization': targets / max(slots, 1),
+            'tokens_per_step': targets / max(measured, 1),
+            'tokens_per_second': targets / max(elapsed, 1e-9),
+            'loss': loss.item(),
+        }
+        if strategy == 'packed':
+            model.eval()
+            results[strategy]['max_logit_diff'] = check_packing(model, PackedDataset(shards, seq_len, seed=seed))
+
+    base = results.get('padded', {}).get('tokens_per_second')
+    print(f"\n{'strategy':<9} {'utilization':>12} {'tokens/step':>12} {'tokens/s':>10} {'speedup':>8}")
+    for strategy, r in results.items():
+        speedup = f"{r['tokens_per_second'] / base:.2f}x" if base else '-'
+        print(f"{strategy:<9} {r['utilization']:>12.1%} {r['tokens_per_step']:>12,.0f} "
+              f"{r['tokens_per_second']:>10,.0f} {speedup:>8}")
+    if 'packed' in results:
+        print(f"Packed logits match per-document logits: max diff {results['packed']['max_logit_diff']:.2e}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Packed and length-bucketed LM batches from token shards')
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('stats', 'tokens-per-batch utilization of each strategy'),
+                            ('benchmark', 'train a small GPT with each strategy and compare tokens/sec')):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument('manifest', help='token_shards.py manifest JSON')
+        p.add_argument('--seq-len', type=int, default=256)
+        p.add_argument('--batch-size', type=int, default=16)
+        p.add_argument('--strategies', default=','.join(STRATEGIES))
+        p.add_argument('--workers', type=int, default=0, help='DataLoader workers')
+    sub.choices['stats'].add_argument('--batches', type=int, default=200, help='batches to sample per strategy')
+    bench = sub.choices['benchmark']
+    bench.add_argument('--steps', type=int, default=20)
+    bench.add_argument('--d-model', type=int, default=256)
+    bench.add_argument('--layers', type=int, default=4)
+    bench.add_argument('--threads', type=int, default=None)
+    bench.add_argument('--attn-backend', choices=['auto', 'sdpa', 'manual'], default='auto')
+    args = parser.parse_args()
+    strategies = tuple(args.strategies.split(','))
+
+    if args.command == 'stats':
+        shards = DocumentShards(args.manifest)
+        print(f"{'strategy':<9} {'utilization':>12} {'tokens/batch':>13} {'slots/batch':>12}")
+        for strategy in strategies:
+            loader = make_loader(strategy, shards, args.seq_len, args.batch_size, num_workers=args.workers)
+            s = loader_stats(loader, args.batches)
+            print(f"{strategy:<9} {s['utilization']:>12.1%} {s['tokens_per_batch']:>13,.0f} "
+                  f"{s['slots'] / max(s['batches'], 1):>12,.0f}")
+    else:
+        benchmark(args.manifest, seq_len=args.seq_len, batch_size=args.batch_size, steps=args.steps,
+                  strategies=strategies, d_model=args.d_model, n_layers=args.layers, threads=args.threads,
+                  attn_backend=args.attn_backend, num_workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Headless resource profiler for long jobs (tokenizer training, corpus
+cleaning, the spider).
+
+Samples CPU, RSS, I/O bytes and thread counts of a process and all of its
+children into a fixed-size ring buffer from a background thread. CPU is
+derived from cpu_times deltas, so sampling never blocks the way
+psutil.cpu_percent(interval=1) does and needs no display.
+
+Use:  with ResourceProfiler(interval=0.5) as prof:
+          spm.SentencePieceTrainer.train(...)
+      prof.write_csv('train_profile.csv'); prof.render('train_profile.png')
+Run:  python resource_profiler.py --csv crawl.csv --png crawl.png -- scrapy crawl daraz
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import threading
+import time
+
+import numpy as np
+import psutil
+
+FIELDS = ('elapsed_s', 'cpu_percent', 'rss_mb', 'read_mb', 'write_mb', 'threads', 'processes')
+
+
+class ResourceProfiler:
+    """Background sampler of a process tree; use as a context manager or call start()/stop()."""
+
+    def __init__(self, pid=None, interval=1.0, capacity=86400, include_children=True):
+        self.pid = pid or os.getpid()
+        self.interval = interval
+        self.include_children = include_children
+        # Ring buffer: one row per sample, oldest rows overwritten once full
+        self.buffer = np.zeros((capacity, len(FIELDS)), dtype=np.float32)
+        self.count = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_time = None
+        self._last_cpu = None
+        self._last_time = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def start(self):
+        try:
+            self._root = psutil.Process(self.pid)
+        except psutil.NoSuchProcess:
+            self._root = None
+        self._start_time = time.monotonic()
+        # One synchronous sample, so even a process that exits right away has a row
+        self.sample()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='resource-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.sample()
+
+    def _processes(self):
+        if self._root is None:
+            return []
+        procs = [self._root]
+        if self.include_children:
+            try:
+                procs += self._root.children(recursive=True)
+            except psutil.NoSuchProcess:
+                pass
+        return procs
+
+    def sample(self):
+        """Take one sample now and append it to the ring buffer."""
+        cpu_total = rss = read = write = threads = 0
+        procs = 0
+        for proc in self._processes():
+            try:
+                with proc.oneshot():
+                    times = proc.cpu_times()
+                    cpu_total += times.user + times.system
+                    rss += proc.memory_info().rss
+                    threads += proc.num_threads()
+                    try:
+                        io = proc.io_counters()
+                        read += io.read_bytes
+                        write += io.write_bytes
+                    except (AttributeError, psutil.AccessDenied):
+                        pass
+                procs += 1
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                continue
+
+        if not procs:
+            # The process tree is gone; keep the last real sample as the final one
+            return
+        now = time.monotonic()
+        if self._last_cpu is None:
+            cpu_percent = 0.0
+        else:
+            cpu_percent = max(0.0, (cpu_total - self._last_cpu) / max(now - self._last_time, 1e-9) * 100)
+        self._last_cpu, self._last_time = cpu_total, now
+
+        row = (now - self._start_time, cpu_percent, rss / 2**20, read / 2**20, write / 2**20, threads, procs)
+        self.buffer[self.count % len(self.buffer)] = row
+        self.count += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except psutil.NoSuchProcess:
+                break
+            self._stop.wait(self.interval)
+
+    def samples(self):
+        """Samples in chronological order as a (n, len(FIELDS)) array."""
+        capacity = len(self.buffer)
+        if self.count <= capacity:
+            return self.buffer[:self.count].copy()
+        start = self.count % capacity
+        return np.concatenate([self.buffer[start:], self.buffer[:start]])
+
+    def summary(self):
+        data = self.samples()
+        if not len(data):
+            return {}
+        col = {name: data[:, i] for i, name in enumerate(FIELDS)}
+        return {
+            'duration_s': float(col['elapsed_s'][-1]),
+            'samples': int(self.count),
+            'cpu_percent_mean': float(col['cpu_percent'][1:].mean()) if len(data) > 1 else 0.0,
+            'cpu_percent_peak': float(col['cpu_percent'].max()),
+            'rss_mb_peak': float(col['rss_mb'].max()),
+            'read_mb': float(col['read_mb'][-1] - col['read_mb'][0]),
+            'write_mb': float(col['write_mb'][-1] - col['write_mb'][0]),
+            'threads_peak': int(col['threads'].max()),
+            'processes_peak': int(col['processes'].max()),
+        }
+
+    def write_csv(self, path):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            for row in self.samples():
+                writer.writerow([f"{v:.3f}" for v in row])
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'summary': self.summary(), 'fields': FIELDS,
+                       'samples': self.samples().round(3).tolist()}, f)
+
+    def render(self, path, title='Resource profile'):
+        """Static report after the run; matplotlib is only needed here."""
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        data = self.samples()
+        t = data[:, 0]
+        fig, axes = plt.subplots(3, 1, figsize=(10, 9), sharex=True)
+        fig.suptitle(title, fontsize=14, fontweight='bold')
+        axes[0].plot(t, data[:, 1], 'b-')
+        axes[0].set_ylabel('CPU (%)')
+        axes[1].plot(t, data[:, 2], 'g-')
+        axes[1].set_ylabel('RSS (MB)')
+        axes[2].plot(t, data[:, 3], label='read')
+        axes[2].plot(t, data[:, 4], label='write')
+        axes[2].set_ylabel('I/O (MB)')
+        axes[2].set_xlabel('Time (seconds)')
+        axes[2].legend()
+        for ax in axes:
+            ax.grid(True, alpha=0.3)
+        fig.tight_layout()
+        fig.savefig(path, dpi=100)
+        plt.close(fig)
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"\n{'='*50}")
+        if not s:
+            print("No samples: the process exited before it could be measured")
+            print(f"{'='*50}")
+            return
+        print(f"Duration: {s['duration_s']:.1f}s ({s['samples']} samples)")
+        print(f"CPU: mean {s['cpu_percent_mean']:.0f}%, peak {s['cpu_percent_peak']:.0f}%")
+        print(f"Peak RSS: {s['rss_mb_peak']:.0f} MB")
+        print(f"I/O: read {s['read_mb']:.1f} MB, write {s['write_mb']:.1f} MB")
+        print(f"Peak threads: {s['threads_peak']} in {s['processes_peak']} process(es)")
+        print(f"{'='*50}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile a command and its children headlessly')
+    parser.add_argument('--interval', type=float, default=1.0)
+    parser.add_argument('--csv', default=None)
+    parser.add_argument('--json', default=None)
+    parser.add_argument('--png', default=None)
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='-- command to run')
+    args = parser.parse_args()
+
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not command:
+        parser.error('no command given')
+
+    proc = subprocess.Popen(command)
+    profiler = ResourceProfiler(pid=proc.pid, interval=args.interval)
+    profiler.start()
+    try:
+        returncode = proc.wait()
+    except KeyboardInterrupt:
+        proc.terminate()
+        returncode = proc.wait()
+    finally:
+        profiler.stop()
+
+    # Reporting problems must never replace the profiled command's exit code
+    try:
+        profiler.print_summary()
+        if args.csv:
+            profiler.write_csv(args.csv)
+        if args.json:
+            profiler.write_json(args.json)
+        if args.png:
+            profiler.render(args.png, title=' '.join(command)[:80])
+    except Exception as e:
+        print(f"⚠️ Could not write the profile report: {e}")
+    raise SystemExit(returncode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Review rating classifier on top of the decoder-only GPT in decoder_only.py.
+
+Reviews are tokenized with ne_spm, right-padded, run through the GPT
+blocks and mean-pooled over real tokens into a 5-way star-rating head.
+Because attention is causal, real tokens never attend to right padding,
+so the backbone runs on the plain causal path with no mask tensor.
+
+Checkpoints are torch.save({'config': ..., 'state_dict': ...}) files:
+    model = ReviewClassifier.load('review_model.pt')
+Exported TorchScript variants (export_model.py) carry the same config:
+    model = load_classifier('review_model_int8.ts')
+"""
+
+import json
+
+import torch
+import torch.nn as nn
+
+from decoder_only import GPT
+
+# Class i is a rating of RATINGS[i] stars
+RATINGS = (1, 2, 3, 4, 5)
+PLACEHOLDER_TEXTS = {'', 'No review text'}
+
+
+class ReviewClassifier(nn.Module):
+    def __init__(self, vocab_size, num_labels=len(RATINGS), d_model=256, num_heads=8, n_layers=4, max_len=256,
+                 ff_dim=1024, pad_id=0, attn_backend='auto'):
+        super().__init__()
+        self.config = dict(vocab_size=vocab_size, num_labels=num_labels, d_model=d_model, num_heads=num_heads,
+                           n_layers=n_layers, max_len=max_len, ff_dim=ff_dim, pad_id=pad_id)
+        self.max_len = max_len
+        self.pad_id = pad_id
+        self.backbone = GPT(vocab_size, d_model=d_model, num_heads=num_heads, n_layers=n_layers, max_len=max_len,
+                            ff_dim=ff_dim, attn_backend=attn_backend)
+        self.head = nn.Linear(d_model, num_labels)
+
+    def forward(self, idx, lengths):
+        """idx (B, T) right-padded token ids, lengths (B,) real token counts -> logits (B, num_labels)."""
+        h = self.backbone.hidden_states(idx)
+        keep = torch.arange(idx.size(1), device=idx.device)[None, :] < lengths[:, None]
+        pooled = (h * keep[..., None]).sum(dim=1) / lengths.clamp(min=1)[:, None]
+        return self.head(pooled)
+
+    def save(self, path):
+        torch.save({'config': self.config, 'state_dict': self.state_dict()}, path)
+
+    @classmethod
+    def load(cls, path, map_location='cpu', attn_backend='auto'):
+        checkpoint = torch.load(path, map_location=map_location)
+        model = cls(**checkpoint['config'], attn_backend=attn_backend)
+        model.load_state_dict(checkpoint['state_dict'])
+        return model.eval()
+
+
+class ScriptedClassifier:
+    """TorchScript (or any callable) classifier with the attributes the scoring code reads."""
+
+    def __init__(self, fn, config):
+        self.fn = fn
+        self.config = config
+        self.max_len = config['max_len']
+        self.pad_id = config['pad_id']
+
+    def __call__(self, idx, lengths):
+        return self.fn(idx, lengths)
+
+
+def save_scripted(module, config, path):
+    torch.jit.save(module, path, _extra_files={'config.json': json.dumps(config)})
+
+
+def load_classifier(path, attn_backend='auto'):
+    """Load a .pt checkpoint as ReviewClassifier or a .ts export as ScriptedClassifier."""
+    if not path.endswith('.ts'):
+        return ReviewClassifier.load(path, attn_backend=attn_backend)
+    extra = {'config.json': ''}
+    module = torch.jit.load(path, map_location='cpu', _extra_files=extra)
+    return ScriptedClassifier(module.eval(), json.loads(extra['config.json']))
+
+
+def pad_batch(token_lists, max_len, pad_id=0):
+    """Right-pad (and truncate to max_len) into (ids, lengths) tensors."""
+    lengths = [min(len(t), max_len) for t in token_lists]
+    width = max(max(lengths), 1)
+    idx = torch.full((len(token_lists), width), pad_id, dtype=torch.long)
+    for i, (tokens, length) in enumerate(zip(token_lists, lengths)):
+        if length:
+            idx[i, :length] = torch.tensor(tokens[:length], dtype=torch.long)
+    return idx, torch.tensor(lengths, dtype=torch.long)
+
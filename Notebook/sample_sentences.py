@@ -0,0 +1,160 @@
+"""
+Streaming stratified sampler for tokenizer training input.
+
+SentencePiece's input_sentence_size / shuffle_input_sentence make the
+trainer load and shuffle the whole corpus in memory before it starts.
+This does one streaming pass over every input and keeps a fixed-size
+reservoir per source (Algorithm L, so skipped lines cost no RNG calls),
+then writes exactly N shuffled sentences with per-source quotas.
+
+Run: python sample_sentences.py -n 2000000 -o ne_sample.txt \\
+         --source wiki=combined_nepali_wikipedia_cleaned.txt:0.4 \\
+         --source news=new_cleaned.txt:0.3 \\
+         --source en=cc100_en_cleaned.txt:0.2 \\
+         --source reviews=../daraz_product_review/output/daraz_products_1.csv:0.1
+Then train with input='ne_sample.txt' and no input_sentence_size.
+"""
+
+import argparse
+import csv
+import math
+import random
+import time
+
+
+class Reservoir:
+    """Uniform fixed-size sample of a stream using Algorithm L."""
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.items = []
+        self.seen = 0
+        self.next_index = size
+        self.w = math.exp(math.log(rng.random()) / size) if size else 0.0
+        self._advance()
+
+    def _advance(self):
+        if self.size == 0:
+            self.next_index = math.inf
+            return
+        # Number of items to skip before the next replacement
+        self.next_index += int(math.log(self.rng.random()) / math.log(1 - self.w)) + 1 if self.w < 1 else 1
+
+    def offer(self, item):
+        if self.seen < self.size:
+            self.items.append(item)
+        elif self.seen + 1 == self.next_index:
+            self.items[self.rng.randrange(self.size)] = item
+            self.w *= math.exp(math.log(self.rng.random()) / self.size)
+            self._advance()
+        self.seen += 1
+
+
+def iter_sentences(path, csv_column='review_text', min_length=5, max_length=8192):
+    """Yield stripped sentences from a text file (one per line) or a review CSV column."""
+    if path.endswith('.csv'):
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                for line in (row.get(csv_column) or '').splitlines():
+                    line = line.strip()
+                    if min_length <= len(line) and len(line.encode('utf-8')) <= max_length:
+                        yield line
+        return
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            line = line.strip()
+            if min_length <= len(line) and len(line.encode('utf-8')) <= max_length:
+                yield line
+
+
+def parse_source(spec):
+    """'name=path1,path2:weight' -> (name, [paths], weight)"""
+    name, _, rest = spec.partition('=')
+    paths, sep, weight = rest.rpartition(':')
+    if not sep or not name:
+        raise argparse.ArgumentTypeError(f"Expected name=path[,path...]:weight, got '{spec}'")
+    return name, paths.split(','), float(weight)
+
+
+def compute_quotas(total, weights):
+    """Split total by weights using largest remainders so quotas sum to exactly total."""
+    weight_sum = sum(weights.values())
+    raw = {name: total * w / weight_sum for name, w in weights.items()}
+    quotas = {name: int(v) for name, v in raw.items()}
+    leftover = total - sum(quotas.values())
+    for name in sorted(raw, key=lambda n: raw[n] - quotas[n], reverse=True)[:leftover]:
+        quotas[name] += 1
+    return quotas
+
+
+def sample_sentences(sources, total, output_file, spare=0.1, seed=42, shuffle=True, csv_column='review_text',
+                     min_length=5, verbose=True):
+    """Write exactly `total` sentences drawn from sources = [(name, paths, weight), ...]."""
+    rng = random.Random(seed)
+    quotas = compute_quotas(total, {name: w for name, _, w in sources})
+    # Each reservoir holds a few extra lines so a short source's shortfall can be refilled
+    extra = int(math.ceil(total * spare))
+    reservoirs = {name: Reservoir(quotas[name] + extra, rng) for name, _, _ in sources}
+
+    start_time = time.time()
+    for name, paths, _ in sources:
+        reservoir = reservoirs[name]
+        for path in paths:
+            if verbose:
+                print(f"Sampling {name}: {path}...")
+            for line in iter_sentences(path, csv_column, min_length):
+                reservoir.offer(line)
+
+    # Per-source quota first, then spread any shortfall over sources with spare lines
+    chosen = {}
+    spare_items = []
+    for name, _, _ in sources:
+        items = reservoirs[name].items
+        rng.shuffle(items)
+        chosen[name] = items[:quotas[name]]
+        spare_items.extend((name, item) for item in items[quotas[name]:])
+    shortfall = total - sum(len(v) for v in chosen.values())
+    if shortfall > 0:
+        rng.shuffle(spare_items)
+        for name, item in spare_items[:shortfall]:
+            chosen[name].append(item)
+
+    lines = [line for items in chosen.values() for line in items]
+    if shuffle:
+        rng.shuffle(lines)
+    with open(output_file, 'w', encoding='utf-8') as out:
+        for line in lines:
+            out.write(line + '\n')
+
+    stats = {name: {'seen': reservoirs[name].seen, 'quota': quotas[name], 'written': len(chosen[name])}
+             for name, _, _ in sources}
+    if verbose:
+        print(f"\n✓ Wrote {len(lines):,} sentences to {output_file} in {time.time() - start_time:.1f}s")
+        for name, s in stats.items():
+            print(f"  {name}: seen {s['seen']:,}, quota {s['quota']:,}, written {s['written']:,}")
+        if len(lines) < total:
+            print(f"⚠️ Only {len(lines):,} of {total:,} sentences available across all sources")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stratified reservoir sampler for tokenizer training')
+    parser.add_argument('-n', '--num-sentences', type=int, required=True)
+    parser.add_argument('-o', '--output', required=True)
+    parser.add_argument('--source', action='append', type=parse_source, required=True,
+                        help='name=path[,path...]:weight (repeatable; .csv paths read --csv-column)')
+    parser.add_argument('--csv-column', default='review_text')
+    parser.add_argument('--min-length', type=int, default=5)
+    parser.add_argument('--spare', type=float, default=0.1,
+                        help='extra reservoir capacity (fraction of N) used to refill short sources')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-shuffle', action='store_true')
+    args = parser.parse_args()
+
+    sample_sentences(args.source, args.num_sentences, args.output, spare=args.spare, seed=args.seed,
+                     shuffle=not args.no_shuffle, csv_column=args.csv_column, min_length=args.min_length)
+
+
+if __name__ == "__main__":
+    main()
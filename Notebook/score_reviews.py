@@ -0,0 +1,178 @@
+"""
+Batch rating/sentiment scoring of scraped reviews on CPU.
+
+Streams review_text from the spider's output/daraz_products_*.csv files
+(or 'Review Text' from product_reviews.csv) in chunks. Each chunk is
+tokenized with ne_spm in one call, sorted by length and cut into batches
+under a token budget, so a batch of short reviews is not padded out to the
+longest review in the chunk. Predictions are restored to input order and
+appended to the output CSV chunk by chunk.
+
+Run: python score_reviews.py ../daraz_product_review/output/daraz_products_*.csv \\
+         --checkpoint review_model.pt --tokenizer ne_spm.model -o review_scores.csv --threads 8
+"""
+
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+import torch
+
+from review_model import PLACEHOLDER_TEXTS, RATINGS, ReviewClassifier, load_classifier, pad_batch
+from token_shards import load_tokenizer
+
+TEXT_COLUMNS = ('review_text', 'Review Text')
+OUTPUT_FIELDS = ('source', 'row', 'review_id', 'product_id', 'product_name',
+                 'pred_rating', 'confidence', 'sentiment')
+# Input column names for each output key column, spider first
+KEY_COLUMNS = {
+    'review_id': ('review_id',),
+    'product_id': ('product_id',),
+    'product_name': ('product_name', 'Product Name'),
+}
+
+
+def iter_review_chunks(paths, chunk_size, text_column=None):
+    """Yield (path, first_row_index, rows) with at most chunk_size rows each."""
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.DictReader(f)
+            column = text_column or next((c for c in TEXT_COLUMNS if c in (reader.fieldnames or ())), None)
+            if column is None:
+                print(f"⚠️ {path}: no review text column ({', '.join(TEXT_COLUMNS)}), skipping")
+                continue
+            rows = []
+            start = 0
+            for i, row in enumerate(reader):
+                row['_text'] = (row.get(column) or '').strip()
+                rows.append(row)
+                if len(rows) >= chunk_size:
+                    yield path, start, rows
+                    start = i + 1
+                    rows = []
+            if rows:
+                yield path, start, rows
+
+
+def bucket_batches(lengths, max_batch_size, max_tokens):
+    """Group indices sorted by length so each batch's padded size stays under max_tokens."""
+    order = np.argsort(lengths, kind='stable')
+    batches = []
+    batch = []
+    for i in order:
+        # Sorted ascending, so the current item is the longest in the batch
+        width = max(int(lengths[i]), 1)
+        if batch and (len(batch) >= max_batch_size or (len(batch) + 1) * width > max_tokens):
+            batches.append(batch)
+            batch = []
+        batch.append(int(i))
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def predict_chunk(model, tokenizer, texts, max_batch_size=64, max_tokens=8192):
+    """Return (probs (N, labels) float32, real_tokens, padded_tokens) for a list of texts."""
+    token_lists = tokenizer.encode(texts)
+    lengths = np.fromiter((min(len(t), model.max_len) for t in token_lists), dtype=np.int64, count=len(texts))
+    probs = np.zeros((len(texts), model.config['num_labels']), dtype=np.float32)
+    padded = 0
+    for batch in bucket_batches(lengths, max_batch_size, max_tokens):
+        idx, batch_lengths = pad_batch([token_lists[i] for i in batch], model.max_len, model.pad_id)
+        padded += idx.numel()
+        logits = model(idx, batch_lengths)
+        probs[batch] = logits.float().softmax(dim=-1).numpy()
+    return probs, int(lengths.sum()), padded
+
+
+def load_model(checkpoint, tokenizer_path, attn_backend='auto', random_init=False):
+    kind, tokenizer = load_tokenizer(tokenizer_path)
+    if kind != 'spm':
+        raise ValueError("Review scoring expects the ne_spm SentencePiece .model")
+    if random_init:
+        # Untrained weights, only for measuring throughput
+        model = ReviewClassifier(tokenizer.get_piece_size(), pad_id=max(tokenizer.pad_id(), 0),
+                                 attn_backend=attn_backend).eval()
+    else:
+        model = load_classifier(checkpoint, attn_backend=attn_backend)
+    return model, tokenizer
+
+
+def score_reviews(paths, checkpoint, tokenizer_path, output_file, threads=None, chunk_size=8192, max_batch_size=64,
+                  max_tokens=8192, text_column=None, attn_backend='auto', random_init=False, verbose=True):
+    """Score every review in paths and write OUTPUT_FIELDS rows to output_file. Returns stats."""
+    if threads:
+        torch.set_num_threads(threads)
+    model, tokenizer = load_model(checkpoint, tokenizer_path, attn_backend, random_init)
+    ratings = np.asarray(RATINGS, dtype=np.float32)
+
+    stats = {'reviews': 0, 'scored': 0, 'skipped': 0, 'real_tokens': 0, 'padded_tokens': 0}
+    start_time = time.time()
+    with open(output_file, 'w', newline='', encoding='utf-8') as out, torch.inference_mode():
+        writer = csv.writer(out)
+        writer.writerow(OUTPUT_FIELDS)
+        for path, first_row, rows in iter_review_chunks(paths, chunk_size, text_column):
+            scored = [i for i, row in enumerate(rows) if row['_text'] not in PLACEHOLDER_TEXTS]
+            probs, real, padded = predict_chunk(model, tokenizer, [rows[i]['_text'] for i in scored],
+                                                max_batch_size, max_tokens) if scored else (None, 0, 0)
+            predictions = {}
+            if scored:
+                best = probs.argmax(axis=1)
+                # Expected star rating mapped onto [-1, 1]
+                sentiment = (probs @ ratings - 3.0) / 2.0
+                for j, i in enumerate(scored):
+                    predictions[i] = (RATINGS[best[j]], f"{probs[j, best[j]]:.4f}", f"{sentiment[j]:.4f}")
+
+            source = os.path.basename(path)
+            for i, row in enumerate(rows):
+                keys = [next((row[c] for c in KEY_COLUMNS[k] if row.get(c)), '') for k in KEY_COLUMNS]
+                writer.writerow([source, first_row + i, *keys, *predictions.get(i, ('', '', ''))])
+            out.flush()
+
+            stats['reviews'] += len(rows)
+            stats['scored'] += len(scored)
+            stats['skipped'] += len(rows) - len(scored)
+            stats['real_tokens'] += real
+            stats['padded_tokens'] += padded
+            if verbose:
+                elapsed = time.time() - start_time
+                print(f"  {stats['reviews']:,} reviews ({stats['scored'] / max(elapsed, 1e-9):,.0f} reviews/s)...")
+
+    elapsed = time.time() - start_time
+    stats['seconds'] = elapsed
+    stats['reviews_per_second'] = stats['scored'] / max(elapsed, 1e-9)
+    stats['padding_efficiency'] = stats['real_tokens'] / max(stats['padded_tokens'], 1)
+    if verbose:
+        print(f"\n✓ Scored {stats['scored']:,} of {stats['reviews']:,} reviews in {elapsed:.1f}s "
+              f"({stats['reviews_per_second']:,.0f} reviews/s, {torch.get_num_threads()} threads)")
+        print(f"  Skipped (empty text): {stats['skipped']:,}")
+        print(f"  Padding efficiency: {stats['padding_efficiency']:.1%} real tokens")
+        print(f"Predictions saved: {output_file}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batch rating/sentiment scoring of review CSVs')
+    parser.add_argument('inputs', nargs='+', help='spider output CSVs or product_reviews.csv')
+    parser.add_argument('-o', '--output', default='review_scores.csv')
+    parser.add_argument('--checkpoint', default='review_model.pt',
+                        help='.pt checkpoint or a .ts export from export_model.py')
+    parser.add_argument('--tokenizer', default='ne_spm.model')
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=8192, help='reviews read, sorted and written at a time')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--max-tokens', type=int, default=8192, help='padded tokens per batch')
+    parser.add_argument('--text-column', default=None)
+    parser.add_argument('--attn-backend', choices=['auto', 'sdpa', 'manual'], default='auto')
+    parser.add_argument('--random-init', action='store_true', help='untrained model, for throughput tests only')
+    args = parser.parse_args()
+
+    score_reviews(args.inputs, args.checkpoint, args.tokenizer, args.output, threads=args.threads,
+                  chunk_size=args.chunk_size, max_batch_size=args.batch_size, max_tokens=args.max_tokens,
+                  text_column=args.text_column, attn_backend=args.attn_backend, random_init=args.random_init)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Pre-tokenize cleaned corpora into flat uint16 shards and serve fixed-length
+training windows from them by memory-mapping.
+
+Both tokenizers fit in 16 bits (ne_spm: 16000, nepali_tokenizer.json from
+train_tokenizer.py: 10000), so every token is 2 bytes on disk. Each shard
+is a .bin of concatenated token ids (an EOS id after every line) plus an
+.idx.npy of int64 document start offsets; a JSON manifest ties them together.
+
+Build: python token_shards.py build ne_cleaned.txt news_cleaned.txt \\
+           --tokenizer ne_spm.model --out-prefix data/ne_tokens
+Use:   from token_shards import TokenShardDataset
+       ds = TokenShardDataset('data/ne_tokens.json', seq_len=256)
+"""
+
+import argparse
+import json
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+TOKEN_DTYPE = np.uint16
+DEFAULT_SHARD_TOKENS = 100_000_000  # ~200 MB per shard
+
+_tokenizer = None
+_tokenizer_kind = None
+
+
+def load_tokenizer(path):
+    """Load a SentencePiece .model or a HuggingFace tokenizers .json. Returns (kind, tokenizer)."""
+    if path.endswith('.model'):
+        import sentencepiece as spm
+        sp = spm.SentencePieceProcessor()
+        sp.load(path)
+        return 'spm', sp
+    from tokenizers import Tokenizer
+    return 'hf', Tokenizer.from_file(path)
+
+
+def tokenizer_info(path):
+    kind, tok = load_tokenizer(path)
+    if kind == 'spm':
+        vocab_size = tok.get_piece_size()
+        eos_id = tok.eos_id() if tok.eos_id() >= 0 else tok.piece_to_id('</s>')
+    else:
+        vocab_size = tok.get_vocab_size()
+        eos_id = tok.token_to_id('[SEP]')
+    return vocab_size, eos_id
+
+
+def _init_worker(path):
+    global _tokenizer, _tokenizer_kind
+    _tokenizer_kind, _tokenizer = load_tokenizer(path)
+
+
+def encode_batch(args):
+    """Worker: encode a batch of lines into one flat uint16 array plus per-line lengths."""
+    lines, eos_id = args
+    if _tokenizer_kind == 'spm':
+        ids = _tokenizer.encode(lines)
+    else:
+        ids = [enc.ids for enc in _tokenizer.encode_batch(lines, add_special_tokens=False)]
+    lengths = np.fromiter((len(x) + 1 for x in ids), dtype=np.int64, count=len(ids))
+    flat = np.empty(int(lengths.sum()), dtype=TOKEN_DTYPE)
+    pos = 0
+    for x in ids:
+        flat[pos:pos + len(x)] = x
+        flat[pos + len(x)] = eos_id
+        pos += len(x) + 1
+    return flat, lengths
+
+
+def iter_line_batches(paths, batch_size, eos_id):
+    batch = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                batch.append(line)
+                if len(batch) >= batch_size:
+                    yield batch, eos_id
+                    batch = []
+    if batch:
+        yield batch, eos_id
+
+
+class ShardWriter:
+    def __init__(self, out_prefix, shard_tokens):
+        self.out_prefix = out_prefix
+        self.shard_tokens = shard_tokens
+        self.shards = []
+        self.file = None
+
+    def _open(self):
+        path = f"{self.out_prefix}_{len(self.shards):05d}.bin"
+        self.file = open(path, 'wb')
+        self.shards.append({'bin': os.path.basename(path),
+                            'idx': os.path.basename(path[:-4] + '.idx.npy'),
+                            'tokens': 0, 'documents': 0})
+        self.offsets = [0]
+
+    def _close(self):
+        if self.file is None:
+            return
+        self.file.close()
+        np.save(os.path.join(os.path.dirname(self.out_prefix) or '.', self.shards[-1]['idx']),
+                np.asarray(self.offsets, dtype=np.int64))
+        self.file = None
+
+    def write(self, flat, lengths):
+        pos = 0
+        for length in lengths:
+            if self.file is None or self.shards[-1]['tokens'] >= self.shard_tokens:
+                self._close()
+                self._open()
+            # Documents never straddle shards, so each shard is self-contained
+            self.file.write(flat[pos:pos + length].tobytes())
+            pos += length
+            shard = self.shards[-1]
+            shard['tokens'] += int(length)
+            shard['documents'] += 1
+            self.offsets.append(shard['tokens'])
+
+    def close(self):
+        self._close()
+
+
+def build_shards(input_files, tokenizer_path, out_prefix, workers=None, batch_size=4096,
+                 shard_tokens=DEFAULT_SHARD_TOKENS, verbose=True):
+    """Tokenize input_files in parallel into uint16 shards; returns the manifest dict."""
+    vocab_size, eos_id = tokenizer_info(tokenizer_path)
+    if vocab_size > np.iinfo(TOKEN_DTYPE).max + 1:
+        raise ValueError(f"Vocab size {vocab_size} does not fit in uint16 token ids")
+    if eos_id is None or eos_id < 0:
+        raise ValueError("Tokenizer has no EOS/[SEP] token to separate documents")
+    os.makedirs(os.path.dirname(out_prefix) or '.', exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    writer = ShardWriter(out_prefix, shard_tokens)
+    start_time = time.time()
+    total_tokens = 0
+    if verbose:
+        print(f"Tokenizing {len(input_files)} file(s) with {workers} workers (vocab {vocab_size}, eos {eos_id})...")
+
+    with Pool(workers, initializer=_init_worker, initargs=(tokenizer_path,)) as pool:
+        # imap keeps document order stable across runs
+        for i, (flat, lengths) in enumerate(pool.imap(encode_batch, iter_line_batches(input_files, batch_size, eos_id))):
+            writer.write(flat, lengths)
+            total_tokens += len(flat)
+            if verbose and (i + 1) % 50 == 0:
+                elapsed = time.time() - start_time
+                print(f"  {total_tokens:,} tokens ({total_tokens / elapsed:,.0f} tokens/s)...")
+    writer.close()
+
+    manifest = {
+        'tokenizer': os.path.abspath(tokenizer_path),
+        'vocab_size': vocab_size,
+        'eos_id': eos_id,
+        'dtype': np.dtype(TOKEN_DTYPE).name,
+        'total_tokens': total_tokens,
+        'shards': writer.shards,
+    }
+    with open(f"{out_prefix}.json", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    if verbose:
+        elapsed = time.time() - start_time
+        print(f"\n✓ {total_tokens:,} tokens in {len(writer.shards)} shard(s), {elapsed:.1f}s "
+              f"({total_tokens / max(elapsed, 1e-9):,.0f} tokens/s)")
+        print(f"Manifest saved: {out_prefix}.json")
+    return manifest
+
+
+class TokenShardDataset(Dataset):
+    """Random fixed-length windows over memory-mapped token shards.
+
+    Item i is (x, y) with y shifted by one token, both int64 of length
+    seq_len. Window positions depend only on (seed, epoch, i), so results
+    are reproducible and DataLoader workers need no coordination. Shards
+    are opened lazily in each worker; the only copy made is the uint16 to
+    int64 cast of the window itself.
+    """
+
+    def __init__(self, manifest_path, seq_len, num_samples=None, seed=0):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.base_dir = os.path.dirname(manifest_path) or '.'
+        self.seq_len = seq_len
+        self.seed = seed
+        self.epoch = 0
+        self.dtype = np.dtype(self.manifest['dtype'])
+
+        sizes = np.array([s['tokens'] for s in self.manifest['shards']], dtype=np.int64)
+        usable = np.maximum(sizes - seq_len - 1, 0)
+        if usable.sum() == 0:
+            raise ValueError(f"No shard is longer than seq_len + 1 = {seq_len + 1} tokens")
+        # Windows are spread over shards in proportion to their length
+        self.cum_usable = np.cumsum(usable)
+        self.num_samples = num_samples or int(sizes.sum() // seq_len)
+        self._shards = None
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _open(self):
+        self._shards = [np.memmap(os.path.join(self.base_dir, s['bin']), dtype=self.dtype, mode='r')
+                        for s in self.manifest['shards']]
+
+    def __len__(self):
+        return self.num_samples
+
+    def __getitem__(self, i):
+        if self._shards is None:
+            self._open()
+        rng = np.random.default_rng((self.seed, self.epoch, i))
+        pos = int(rng.integers(0, self.cum_usable[-1]))
+        shard = int(np.searchsorted(self.cum_usable, pos, side='right'))
+        start = pos - (int(self.cum_usable[shard - 1]) if shard else 0)
+        window = self._shards[shard][start:start + self.seq_len + 1]
+        tokens = torch.from_numpy(window.astype(np.int64))
+        return tokens[:-1], tokens[1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Token shard builder')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help='tokenize text files into uint16 shards')
+    build.add_argument('input_files', nargs='+')
+    build.add_argument('--tokenizer', required=True, help='ne_spm.model or nepali_tokenizer.json')
+    build.add_argument('--out-prefix', required=True)
+    build.add_argument('--workers', type=int, default=None)
+    build.add_argument('--batch-size', type=int, default=4096)
+    build.add_argument('--shard-tokens', type=int, default=DEFAULT_SHARD_TOKENS)
+
+    info = sub.add_parser('info', help='print a shard manifest summary')
+    info.add_argument('manifest')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_shards(args.input_files, args.tokenizer, args.out_prefix, workers=args.workers,
+                     batch_size=args.batch_size, shard_tokens=args.shard_tokens)
+    else:
+        with open(args.manifest, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        print(f"Tokenizer: {manifest['tokenizer']} (vocab {manifest['vocab_size']})")
+        print(f"Total tokens: {manifest['total_tokens']:,}")
+        for shard in manifest['shards']:
+            print(f"  {shard['bin']}: {shard['tokens']:,} tokens, {shard['documents']:,} documents")
+
+
+if __name__ == "__main__":
+    main()
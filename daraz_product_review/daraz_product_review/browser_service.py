@@ -0,0 +1,195 @@
+"""
+Long-lived Chromium service the spider can attach to over CDP.
+
+Run: python -m daraz_product_review.browser_service --port 9222
+Then: scrapy crawl daraz -s BROWSER_SERVICE_CDP_URL=http://127.0.0.1:9222
+
+The supervisor keeps one Chromium running, restarts it if it crashes and
+recycles it when its process tree grows past a memory limit or a maximum
+age. What the spider saves is the browser launch per crawl: scrapy-playwright
+opens its own fresh (incognito-like) contexts over CDP, so cookies and HTTP
+cache are not carried over between runs. The spider falls back to launching
+its own browser when the service is not reachable.
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import time
+import urllib.request
+from datetime import datetime
+
+import psutil
+
+DEFAULT_PORT = 9222
+# Chromium needs its own user data dir to serve CDP; spider contexts do not share it
+DEFAULT_PROFILE_DIR = os.path.expanduser('~/.cache/daraz_browser/profile')
+
+# Same flags the spider uses for its in-process launch
+CHROMIUM_ARGS = [
+    '--headless=new',
+    '--disable-blink-features=AutomationControlled',
+    '--disable-dev-shm-usage',
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-web-security',
+    '--allow-running-insecure-content',
+    '--no-first-run',
+    '--no-default-browser-check',
+    '--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+]
+
+
+def is_available(cdp_url, timeout=1.0):
+    """Return True if a browser answers on the CDP endpoint"""
+    try:
+        with urllib.request.urlopen(f"{cdp_url.rstrip('/')}/json/version", timeout=timeout) as resp:
+            return 'webSocketDebuggerUrl' in json.loads(resp.read().decode('utf-8'))
+    except Exception:
+        return False
+
+
+def chromium_executable():
+    """Locate the Chromium build installed by `playwright install`"""
+    from playwright.sync_api import sync_playwright
+    with sync_playwright() as p:
+        return p.chromium.executable_path
+
+
+def log(message):
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+
+class BrowserSupervisor:
+    """Start Chromium, restart it on crash and recycle it on memory growth or age"""
+
+    def __init__(self, port=DEFAULT_PORT, profile_dir=DEFAULT_PROFILE_DIR, max_rss_mb=2048,
+                 max_age_seconds=6 * 3600, check_interval=10, executable=None):
+        self.port = port
+        self.profile_dir = profile_dir
+        self.max_rss_mb = max_rss_mb
+        self.max_age_seconds = max_age_seconds
+        self.check_interval = check_interval
+        self.executable = executable
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.running = True
+
+    @property
+    def cdp_url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    def start(self):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        executable = self.executable or chromium_executable()
+        args = [
+            executable,
+            f'--remote-debugging-port={self.port}',
+            f'--user-data-dir={self.profile_dir}',
+            *CHROMIUM_ARGS,
+        ]
+
+        self.process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.started_at = time.monotonic()
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if is_available(self.cdp_url):
+                log(f"🌐 Browser up on {self.cdp_url} (pid {self.process.pid})")
+                return True
+            if self.process.poll() is not None:
+                break
+            time.sleep(0.5)
+        log("❌ Browser failed to come up")
+        return False
+
+    def stop(self, timeout=10):
+        if not self.process or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def tree_rss_mb(self):
+        """Resident memory of Chromium and all its renderer/GPU children"""
+        try:
+            root = psutil.Process(self.process.pid)
+            procs = [root] + root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return 0.0
+        total = 0
+        for proc in procs:
+            try:
+                total += proc.memory_info().rss
+            except psutil.NoSuchProcess:
+                continue
+        return total / (1024 * 1024)
+
+    def recycle_reason(self):
+        if self.process.poll() is not None:
+            return f"crashed (exit code {self.process.returncode})"
+        if not is_available(self.cdp_url, timeout=5):
+            return "CDP endpoint not responding"
+        rss = self.tree_rss_mb()
+        if self.max_rss_mb and rss > self.max_rss_mb:
+            return f"memory {rss:.0f} MB > {self.max_rss_mb} MB"
+        age = time.monotonic() - self.started_at
+        if self.max_age_seconds and age > self.max_age_seconds:
+            return f"age {age/3600:.1f}h > {self.max_age_seconds/3600:.1f}h"
+        return None
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'running', False))
+        backoff = 1
+        try:
+            while self.running:
+                if not self.start():
+                    self.stop()
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+                    continue
+                backoff = 1
+
+                while self.running:
+                    time.sleep(self.check_interval)
+                    reason = self.recycle_reason()
+                    if reason:
+                        self.restarts += 1
+                        log(f"🔄 Recycling browser: {reason} (restart #{self.restarts})")
+                        break
+                self.stop()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            log("🏁 Browser service stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Persistent Chromium service for the Daraz spider')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--profile-dir', default=DEFAULT_PROFILE_DIR)
+    parser.add_argument('--max-rss-mb', type=int, default=2048, help='recycle above this RSS (0 disables)')
+    parser.add_argument('--max-age-hours', type=float, default=6, help='recycle after this uptime (0 disables)')
+    parser.add_argument('--check-interval', type=float, default=10)
+    parser.add_argument('--executable', default=None, help='Chromium binary (default: Playwright\'s)')
+    args = parser.parse_args()
+
+    BrowserSupervisor(
+        port=args.port,
+        profile_dir=args.profile_dir,
+        max_rss_mb=args.max_rss_mb,
+        max_age_seconds=args.max_age_hours * 3600,
+        check_interval=args.check_interval,
+        executable=args.executable,
+    ).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import asyncio
+import gzip
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_TRIGGERS = ['review_extraction_error', 'product_parsing_error', 'reviews_section_missing']
+
+logger = logging.getLogger(__name__)
+
+
+class DebugCapture:
+    """Sampled, quota-limited page snapshots written off the event loop"""
+
+    def __init__(self, output_dir='debug', sample_rate=0.0, triggers=None, max_html_bytes=256 * 1024,
+                 screenshots=True, quota=50, fingerprinter=None, stats=None):
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.triggers = set(DEFAULT_TRIGGERS if triggers is None else triggers)
+        self.max_html_bytes = max_html_bytes
+        self.screenshots = screenshots
+        self.quota = quota
+        self.fingerprinter = fingerprinter
+        self.stats = stats
+        self.counters = defaultdict(int)
+        # One writer thread keeps disk and gzip work off the reactor without contending for I/O
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='debug-capture')
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            output_dir=settings.get('DEBUG_CAPTURE_DIR', 'debug'),
+            sample_rate=settings.getfloat('DEBUG_CAPTURE_SAMPLE_RATE', 0.0),
+            triggers=settings.getlist('DEBUG_CAPTURE_TRIGGERS', DEFAULT_TRIGGERS),
+            max_html_bytes=settings.getint('DEBUG_CAPTURE_MAX_HTML_BYTES', 256 * 1024),
+            screenshots=settings.getbool('DEBUG_CAPTURE_SCREENSHOTS', True),
+            quota=settings.getint('DEBUG_CAPTURE_QUOTA', 50),
+            fingerprinter=getattr(crawler, 'request_fingerprinter', None),
+            stats=crawler.stats,
+        )
+
+    def count(self, key, value=1):
+        self.counters[key] += value
+        if self.stats is not None:
+            self.stats.inc_value(f'debug_capture/{key}', value)
+
+    def should_capture(self, trigger=None):
+        """Failure triggers always capture; everything else is sampled. Both share the run quota."""
+        if self.counters['captured'] >= self.quota:
+            self.count('skipped_quota')
+            return False
+        if trigger is not None:
+            return trigger in self.triggers
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def artifact_name(self, request, label):
+        if self.fingerprinter is not None:
+            fp = self.fingerprinter.fingerprint(request).hex()[:16]
+        else:
+            fp = f'{abs(hash(request.url)):016x}'[:16]
+        return f'{fp}_{label}_{int(time.time())}'
+
+    async def maybe_capture(self, page, request, label, trigger=None):
+        """Snapshot the page if sampling or the trigger says so; returns True if captured"""
+        if page is None or not self.should_capture(trigger):
+            return False
+
+        try:
+            # Only the browser round-trips happen on the loop; everything else goes to the writer thread
+            html = await page.content()
+            screenshot = await page.screenshot(type='jpeg', quality=60) if self.screenshots else None
+        except Exception:
+            self.count('failed')
+            return False
+
+        self.count('captured')
+        if trigger:
+            self.count(f'trigger/{trigger}')
+        name = self.artifact_name(request, trigger or label)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, self.write, name, html, screenshot, request.url)
+        future.add_done_callback(lambda f: self._write_done(f, name))
+        return True
+
+    def _write_done(self, future, name):
+        error = future.exception()
+        if error is not None:
+            self.count('write_failed')
+            logger.warning("Debug capture %s could not be written: %s", name, error)
+
+    def write(self, name, html, screenshot, url):
+        os.makedirs(self.output_dir, exist_ok=True)
+        data = html.encode('utf-8')
+        if len(data) > self.max_html_bytes:
+            data = data[:self.max_html_bytes]
+            self.count('truncated')
+        header = f'<!-- {url} -->\n'.encode('utf-8')
+
+        html_path = os.path.join(self.output_dir, f'{name}.html.gz')
+        with gzip.open(html_path, 'wb', compresslevel=6) as f:
+            f.write(header + data)
+        written = os.path.getsize(html_path)
+
+        if screenshot:
+            # JPEG is already compressed; gzip would only cost CPU
+            with open(os.path.join(self.output_dir, f'{name}.jpg'), 'wb') as f:
+                f.write(screenshot)
+            written += len(screenshot)
+        self.count('bytes_written', written)
+
+    def close(self):
+        """Flush pending writes; call from spider close"""
+        self.executor.shutdown(wait=True)
+
+    def summary(self):
+        return dict(self.counters)
@@ -0,0 +1,164 @@
+"""
+Fast language/script tagging for reviews and corpus lines.
+
+Most lines can be tagged from their scripts alone. A batch is turned into
+one array of code points, and Devanagari and Latin letters are counted per
+line with NumPy:
+- mostly Devanagari -> 'ne'
+- Devanagari alongside more Latin -> 'mixed' (code-mixed, "म आज office जान्छु")
+- Latin only -> 'en' or 'ne-rom' (romanized Nepali) from a small marker
+  word list, when one side clearly wins
+- no letters -> 'unknown'
+Only Latin lines the word lists cannot settle go to langdetect, and its
+answers are cached by text hash. Without langdetect those lines are tagged
+'latin'.
+
+Used by the spider (review_language column) and by Notebook/corpus_cleaner.py.
+"""
+
+import hashlib
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+TAGS = ('ne', 'en', 'mixed', 'ne-rom', 'latin', 'unknown')
+DEVANAGARI = (0x0900, 0x097F)
+WORD = re.compile(r"[a-z']+")
+# Frequent function words; a line is decided when enough of its words come from one side only
+ENGLISH_MARKERS = frozenset(
+    'the a an and or but is are was were be been it this that these those to of in on for with at by from '
+    'not no very good bad product quality delivery item fast slow price money received order recommend '
+    'i my me you your we our they their he she his her its have has had do does did will would can could '
+    'should so too also just all nice great best worst ok thanks thank'.split())
+ROMANIZED_MARKERS = frozenset(
+    'cha chha xa chaina chhaina xaina ho hoina ramro naramro ekdam dherai thik thikai ta ni ma ko ki ka '
+    'lai le bata sanga pani ra tara vayo bhayo aayo ayo garnu garyo gardai paisa saman samaan mero hamro '
+    'timro tapai tapaiko hajur dai didi bhai sathi kasto kati kina kaha yo tyo yaslai sasto mahango '
+    'milyo pathaunu pathayo chito dhilo babal jhur'.split())
+
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+
+
+def script_counts(texts):
+    """Per-text (devanagari, latin) letter counts for a list of strings, in one vectorized pass."""
+    if not texts:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    # A separator after every text keeps each segment non-empty for reduceat
+    codes = np.frombuffer('\x00'.join(texts).encode('utf-32-le') + b'\x00\x00\x00\x00', dtype=np.uint32)
+    lengths = np.fromiter((len(t) + 1 for t in texts), dtype=np.int64, count=len(texts))
+    starts = np.cumsum(lengths) - lengths
+    deva = (codes >= DEVANAGARI[0]) & (codes <= DEVANAGARI[1])
+    # Digits and danda/punctuation inside the Devanagari block are not letters
+    deva &= ~(((codes >= 0x0964) & (codes <= 0x096F)) | (codes == 0x0970))
+    lower = codes | 0x20
+    latin = ((lower >= 0x61) & (lower <= 0x7A)) | ((codes >= 0xC0) & (codes <= 0x24F) & (codes != 0xD7) & (codes != 0xF7))
+    return (np.add.reduceat(deva.astype(np.int64), starts),
+            np.add.reduceat(latin.astype(np.int64), starts))
+
+
+class LanguageTagger:
+    """Script-ratio fast path with a cached slow detector for ambiguous Latin-script text"""
+
+    def __init__(self, ne_threshold=0.8, min_letters=3, marker_margin=2,
+                 slow_detector='langdetect', cache_size=100_000, stats=None):
+        self.ne_threshold = ne_threshold
+        self.min_letters = min_letters
+        self.marker_margin = marker_margin
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.stats = stats
+        self.counters = dict.fromkeys(('fast', 'markers', 'slow', 'cache_hits'), 0)
+        self.detect = self._load_detector(slow_detector)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            ne_threshold=settings.getfloat('LANGUAGE_TAGGER_NE_THRESHOLD', 0.8),
+            slow_detector=settings.get('LANGUAGE_TAGGER_SLOW_DETECTOR', 'langdetect'),
+            cache_size=settings.getint('LANGUAGE_TAGGER_CACHE_SIZE', 100_000),
+            stats=crawler.stats,
+        )
+
+    @staticmethod
+    def _load_detector(name):
+        if name != 'langdetect':
+            return None
+        try:
+            from langdetect import DetectorFactory, detect
+        except ImportError:
+            return None
+        DetectorFactory.seed = 0  # deterministic answers so cached and fresh results agree
+        return detect
+
+    def count(self, key, value=1):
+        self.counters[key] += value
+        if self.stats is not None:
+            self.stats.inc_value(f'language_tagger/{key}', value)
+
+    def _by_markers(self, text):
+        words = WORD.findall(text.lower())
+        en = sum(w in ENGLISH_MARKERS for w in words)
+        rom = sum(w in ROMANIZED_MARKERS for w in words)
+        if rom >= en + self.marker_margin or (rom and not en):
+            return 'ne-rom'
+        if en >= rom + self.marker_margin or (en and not rom and len(words) <= 3):
+            return 'en'
+        return None
+
+    def _slow(self, text):
+        key = text_hash(text)
+        tag = self.cache.get(key)
+        if tag is not None:
+            self.cache.move_to_end(key)
+            self.count('cache_hits')
+            return tag
+        self.count('slow')
+        if self.detect is None:
+            tag = 'latin'
+        else:
+            try:
+                # Latin-script text that is not English is romanized Nepali in our data
+                tag = 'en' if self.detect(text) == 'en' else 'ne-rom'
+            except Exception:
+                tag = 'unknown'
+        self.cache[key] = tag
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return tag
+
+    def tag_batch(self, texts):
+        """Tag a list of strings; returns a list of TAGS entries in the same order."""
+        deva, latin = script_counts(texts)
+        letters = deva + latin
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = np.where(letters > 0, deva / np.maximum(letters, 1), 0.0)
+
+        tags = np.full(len(texts), 'unknown', dtype=object)
+        enough = letters >= self.min_letters
+        tags[enough & (ratio >= self.ne_threshold)] = 'ne'
+        # Any Devanagari in a mostly Latin line is still code-mixed, not English
+        tags[enough & (deva > 0) & (ratio < self.ne_threshold)] = 'mixed'
+        # Short Devanagari-only strings are still Nepali
+        tags[~enough & (deva > 0) & (latin == 0)] = 'ne'
+        self.count('fast', int((tags != 'unknown').sum()))
+
+        for i in np.flatnonzero(enough & (deva == 0)):
+            text = texts[i]
+            tag = self._by_markers(text)
+            if tag is not None:
+                self.count('markers')
+            else:
+                tag = self._slow(text)
+            tags[i] = tag
+        return tags.tolist()
+
+    def tag(self, text):
+        return self.tag_batch([text])[0]
+
+    def summary(self):
+        return dict(self.counters)
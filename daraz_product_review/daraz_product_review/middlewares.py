@@ -1,7 +1,10 @@
 from scrapy import signals
 from scrapy.downloadermiddlewares.useragent import UserAgentMiddleware
+import asyncio
 import random
 
+from daraz_product_review.retry_policy import RetryPolicy, BLOCK
+
 class RotateUserAgentMiddleware(UserAgentMiddleware):
     def __init__(self, user_agent):
         self.user_agent = user_agent
@@ -16,4 +19,50 @@ class RotateUserAgentMiddleware(UserAgentMiddleware):
 
     user_agent_list = [
         # Add a list of user agents
-    ]
\ No newline at end of file
+    ]
+
+
+class PolicyRetryMiddleware:
+    """Replaces Scrapy's RetryMiddleware with per-error-class budgets and a circuit breaker"""
+
+    def __init__(self, policy):
+        self.policy = policy
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        # Share the spider's policy so in-page retries and closed() see the same counters
+        policy = getattr(crawler.spider, 'retry_policy', None) or RetryPolicy.from_crawler(crawler)
+        return cls(policy)
+
+    async def process_request(self, request, spider):
+        wait = self.policy.wait_time(request)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return None
+
+    async def process_response(self, request, response, spider):
+        if request.meta.get('dont_retry'):
+            return response
+
+        error_class = self.policy.classify_response(response)
+        self.policy.record_outcome(request, blocked=error_class == BLOCK)
+        if error_class is None:
+            return response
+
+        retry = self.policy.retry_request(request, error_class, f'HTTP {response.status}')
+        if retry is None:
+            return response
+
+        # The retried request gets a fresh page; don't leak the one we were handed
+        page = response.meta.get('playwright_page')
+        if page:
+            await page.close()
+        return retry
+
+    def process_exception(self, request, exception, spider):
+        if request.meta.get('dont_retry'):
+            return None
+
+        error_class = self.policy.classify_exception(exception)
+        self.policy.record_outcome(request, blocked=False)
+        return self.policy.retry_request(request, error_class, type(exception).__name__)
@@ -0,0 +1,171 @@
+import random
+import time
+from collections import deque, defaultdict
+from urllib.parse import urlparse
+
+# Error classes the policy knows about. Each class gets its own retry budget.
+PERMANENT = 'permanent'
+TRANSIENT = 'transient'
+BLOCK = 'block'
+ERROR_CLASSES = (PERMANENT, TRANSIENT, BLOCK)
+
+DEFAULT_BUDGETS = {
+    PERMANENT: 0,   # 404/410 etc. will not come back by asking again
+    TRANSIENT: 3,   # 5xx, timeouts, dropped connections
+    BLOCK: 2,       # 403/429/captcha - retry slowly, let the breaker decide
+}
+
+PERMANENT_HTTP_CODES = {400, 401, 404, 410}
+TRANSIENT_HTTP_CODES = {408, 500, 502, 503, 504, 522, 524}
+BLOCK_HTTP_CODES = {403, 429}
+
+# Daraz (Alibaba stack) redirects blocked clients to a slider captcha page
+BLOCK_URL_MARKERS = ('punish', 'captcha', '_____tmd_____')
+
+PERMANENT_EXCEPTIONS = {'DNSLookupError', 'InvalidURL', 'NotSupported'}
+
+
+class CircuitBreaker:
+    """Pause a domain when the share of blocked responses spikes"""
+
+    def __init__(self, window=20, threshold=0.5, min_samples=5, cooldown=120, max_cooldown=900):
+        self.window = window
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.outcomes = defaultdict(lambda: deque(maxlen=self.window))
+        self.open_until = {}
+        self.trip_counts = defaultdict(int)
+
+    def record(self, domain, blocked):
+        """Record one outcome and trip the breaker if the block rate is too high"""
+        outcomes = self.outcomes[domain]
+        outcomes.append(bool(blocked))
+        if len(outcomes) < self.min_samples or self.is_open(domain):
+            return False
+
+        block_rate = sum(outcomes) / len(outcomes)
+        if block_rate < self.threshold:
+            return False
+
+        # Each consecutive trip doubles the pause, up to max_cooldown
+        self.trip_counts[domain] += 1
+        pause = min(self.max_cooldown, self.cooldown * 2 ** (self.trip_counts[domain] - 1))
+        self.open_until[domain] = time.monotonic() + pause
+        outcomes.clear()
+        return True
+
+    def is_open(self, domain):
+        return self.wait_time(domain) > 0
+
+    def wait_time(self, domain):
+        """Seconds until the domain may be requested again"""
+        return max(0.0, self.open_until.get(domain, 0) - time.monotonic())
+
+    def reset(self, domain):
+        self.trip_counts.pop(domain, None)
+
+
+class RetryPolicy:
+    """Per-error-class retry budgets with exponential backoff and jitter"""
+
+    def __init__(self, budgets=None, backoff_base=2.0, backoff_max=60.0, breaker=None, stats=None):
+        self.budgets = dict(DEFAULT_BUDGETS)
+        self.budgets.update(budgets or {})
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = stats
+        self.counters = {cls: defaultdict(int) for cls in ERROR_CLASSES}
+        self.counters['circuit_breaker'] = defaultdict(int)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        breaker = CircuitBreaker(
+            window=settings.getint('CIRCUIT_BREAKER_WINDOW', 20),
+            threshold=settings.getfloat('CIRCUIT_BREAKER_THRESHOLD', 0.5),
+            min_samples=settings.getint('CIRCUIT_BREAKER_MIN_SAMPLES', 5),
+            cooldown=settings.getfloat('CIRCUIT_BREAKER_COOLDOWN', 120),
+            max_cooldown=settings.getfloat('CIRCUIT_BREAKER_MAX_COOLDOWN', 900),
+        )
+        return cls(
+            budgets=settings.getdict('RETRY_POLICY_BUDGETS'),
+            backoff_base=settings.getfloat('RETRY_POLICY_BACKOFF_BASE', 2.0),
+            backoff_max=settings.getfloat('RETRY_POLICY_BACKOFF_MAX', 60.0),
+            breaker=breaker,
+            stats=crawler.stats,
+        )
+
+    # --- classification -------------------------------------------------
+
+    def classify_response(self, response):
+        """Return the error class of a response, or None if it is usable"""
+        if any(marker in response.url for marker in BLOCK_URL_MARKERS):
+            return BLOCK
+        if response.status in BLOCK_HTTP_CODES:
+            return BLOCK
+        if response.status in PERMANENT_HTTP_CODES:
+            return PERMANENT
+        if response.status in TRANSIENT_HTTP_CODES:
+            return TRANSIENT
+        return None
+
+    def classify_exception(self, exception):
+        """Exceptions are matched by name so Playwright/Twisted need not be imported"""
+        name = type(exception).__name__
+        if name in PERMANENT_EXCEPTIONS:
+            return PERMANENT
+        return TRANSIENT
+
+    # --- budgets and backoff --------------------------------------------
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff in seconds for the given attempt (0-based)"""
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    def count(self, error_class, key, value=1):
+        self.counters[error_class][key] += value
+        if self.stats is not None:
+            self.stats.inc_value(f'retry_policy/{error_class}/{key}', value)
+
+    def retry_request(self, request, error_class, reason):
+        """Build the retry request for a failure, or None when the budget is spent"""
+        self.count(error_class, 'seen')
+        attempts = dict(request.meta.get('policy_attempts', {}))
+        attempt = attempts.get(error_class, 0)
+
+        if attempt >= self.budgets.get(error_class, 0):
+            self.count(error_class, 'gave_up')
+            return None
+
+        attempts[error_class] = attempt + 1
+        delay = self.backoff(attempt)
+        meta = {k: v for k, v in request.meta.items() if k != 'playwright_page'}
+        meta['policy_attempts'] = attempts
+        meta['policy_not_before'] = time.monotonic() + delay
+        meta['policy_last_error'] = f'{error_class}: {reason}'
+
+        self.count(error_class, 'retried')
+        return request.replace(meta=meta, dont_filter=True, priority=request.priority - 1)
+
+    def record_outcome(self, request, blocked):
+        """Feed the circuit breaker; returns True if this outcome tripped it"""
+        domain = urlparse(request.url).netloc
+        tripped = self.breaker.record(domain, blocked)
+        if tripped:
+            self.count('circuit_breaker', 'trips')
+        elif not blocked and not self.breaker.is_open(domain):
+            self.breaker.reset(domain)
+        return tripped
+
+    def wait_time(self, request):
+        """Seconds the request must wait for its own backoff and the domain breaker"""
+        domain = urlparse(request.url).netloc
+        own = request.meta.get('policy_not_before', 0) - time.monotonic()
+        return max(0.0, own, self.breaker.wait_time(domain))
+
+    def summary(self):
+        return {cls: dict(counts) for cls, counts in self.counters.items() if counts}
@@ -0,0 +1,516 @@
+"""
+Local full-text search over scraped reviews (review_text + seller_response).
+
+Run: python -m daraz_product_review.review_index add output/daraz_products_*.csv
+     python -m daraz_product_review.review_index search "battery problem" --max-rating 2 --since 2024-01-01
+     python -m daraz_product_review.review_index merge
+
+Text is NFC-normalized and lowercased. Devanagari digits are folded to
+ASCII and ZWJ/ZWNJ are dropped. Devanagari words and Latin/romanized
+words are split apart, so "म आज office जान्छु" gives four terms, and
+common attached postpositions (फोनमा -> फोन) are stripped. With
+--spm-model each document also gets ne_spm subword terms, which catches
+partial and misspelled words.
+
+Each `add` writes a new immutable segment. The segment holds:
+- sorted UTF-8 terms;
+- delta + varint compressed postings, with doc ids and term frequencies
+  in two streams;
+- per-doc length, product, rating and date arrays for filtering;
+- a JSON-lines doc store for result display.
+Files already indexed are remembered by row count, so re-running `add` on
+a CSV the spider is still writing only indexes the new rows. Re-scraped
+reviews are skipped by content hash. Queries are BM25 over all segments,
+decoding only the postings of the query terms.
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import time
+import unicodedata
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+
+from daraz_product_review.review_store import PLACEHOLDER_TEXTS, product_id_from_url, review_hash
+
+DEVANAGARI_DIGITS = str.maketrans('०१२३४५६७८९', '0123456789')
+# Devanagari letters/marks (danda, digits and the abbreviation sign excluded) or ASCII words
+TOKEN = re.compile(r'[\u0900-\u0963\u0971-\u097F]+|[a-z0-9]+')
+ZERO_WIDTH = re.compile('[\u200c\u200d]')
+# Postpositions written attached to the noun, longest first
+NEPALI_SUFFIXES = ('हरूलाई', 'हरूबाट', 'हरूको', 'हरूका', 'हरूले', 'हरूमा', 'हरू', 'लाई', 'बाट', 'देखि',
+                   'सम्म', 'भन्दा', 'तिर', 'को', 'का', 'की', 'ले', 'मा')
+SUBWORD_PREFIX = '#'
+BM25_K1 = 1.2
+BM25_B = 0.75
+NO_DATE = -1
+EPOCH = date(1970, 1, 1)
+RELATIVE_DATE = re.compile(r'(\d+)\s*(day|week|month|year|hour|minute)s?\s+ago')
+DATE_FORMATS = ('%d %b %Y', '%d %B %Y', '%Y-%m-%d', '%b %d, %Y', '%d/%m/%Y')
+
+
+# -- analysis -----------------------------------------------------------------
+
+def normalize(text):
+    text = unicodedata.normalize('NFC', text).lower().translate(DEVANAGARI_DIGITS)
+    return ZERO_WIDTH.sub('', text)
+
+
+def stem(token):
+    if token[0].isascii():
+        return token
+    for suffix in NEPALI_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 2:
+            return token[:-len(suffix)]
+    return token
+
+
+def analyze(text, sp=None):
+    """Text -> list of index terms (word stems, plus #subword pieces when sp is given)."""
+    text = normalize(text)
+    terms = [stem(t) for t in TOKEN.findall(text)]
+    if sp is not None and text.strip():
+        terms += [SUBWORD_PREFIX + piece for piece in sp.encode(text, out_type=str)
+                  if piece.strip('▁')]
+    return terms
+
+
+@lru_cache(maxsize=65536)
+def parse_review_date(text, scraped_at=None):
+    """'12 Jan 2024', '2024-01-12' or '3 weeks ago' -> days since 1970-01-01, NO_DATE if unknown."""
+    text = (text or '').strip()
+    if not text or text == 'No date':
+        return NO_DATE
+    for fmt in DATE_FORMATS:
+        try:
+            return (datetime.strptime(text, fmt).date() - EPOCH).days
+        except ValueError:
+            pass
+    match = RELATIVE_DATE.search(text.lower())
+    if match:
+        try:
+            base = datetime.strptime(scraped_at, '%Y-%m-%d %H:%M:%S') if scraped_at else datetime.now()
+        except ValueError:
+            base = datetime.now()
+        n, unit = int(match.group(1)), match.group(2)
+        days = {'minute': 0, 'hour': 0, 'day': n, 'week': 7 * n, 'month': 30 * n, 'year': 365 * n}[unit]
+        return ((base - timedelta(days=days)).date() - EPOCH).days
+    return NO_DATE
+
+
+def to_day(value):
+    """'2024-01-31' -> days since epoch"""
+    return (datetime.strptime(value, '%Y-%m-%d').date() - EPOCH).days
+
+
+# -- varint coding ------------------------------------------------------------
+
+def encode_varints(values):
+    """Unsigned LEB128 for a whole array at once. Returns (bytes uint8, bytes per value)."""
+    v = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(v), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        nbytes += v >= np.uint64(1 << shift)
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    starts = np.cumsum(nbytes) - nbytes
+    for k in range(int(nbytes.max()) if len(v) else 0):
+        sel = nbytes > k
+        byte = (v[sel] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (nbytes[sel] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[sel] + k] = (byte | more).astype(np.uint8)
+    return out, nbytes
+
+
+def decode_varints(buf):
+    buf = np.asarray(buf, dtype=np.uint8)
+    if not len(buf):
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(buf < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    group = np.zeros(len(buf), dtype=np.int64)
+    group[starts[1:]] = 1
+    group = np.cumsum(group)
+    shift = (np.arange(len(buf)) - starts[group]) * 7
+    parts = (buf & 0x7F).astype(np.int64) << shift
+    return np.add.reduceat(parts, starts)
+
+
+# -- segments -------------------------------------------------------------------
+
+def _doc_from_row(row, source):
+    url = row.get('product_url') or row.get('Product URL') or ''
+    product_id = row.get('product_id') or (product_id_from_url(url) if url else '')
+    return {
+        'product_id': product_id,
+        'product_name': row.get('product_name') or row.get('Product Name') or '',
+        'review_id': row.get('review_id', ''),
+        'review_text': (row.get('review_text') or row.get('Review Text') or '').strip(),
+        'seller_response': (row.get('seller_response') or '').strip(),
+        'rating': row.get('review_rating') or row.get('Review Rating') or '',
+        'review_date': row.get('review_date') or row.get('Review Date') or '',
+        'reviewer_name': row.get('reviewer_name', ''),
+        'scraped_at': row.get('scraped_at', ''),
+        'source': source,
+    }
+
+
+def write_segment(path, docs, sp=None):
+    """Build one immutable segment directory from a list of doc dicts."""
+    os.makedirs(path, exist_ok=True)
+    vocab = {}
+    term_ids, doc_ids, tfs = [], [], []
+    doc_len = np.zeros(len(docs), dtype=np.int32)
+    products = {}
+    doc_product = np.zeros(len(docs), dtype=np.int32)
+    doc_rating = np.zeros(len(docs), dtype=np.int8)
+    doc_date = np.full(len(docs), NO_DATE, dtype=np.int32)
+
+    with open(os.path.join(path, 'docs.jsonl'), 'wb') as store:
+        offsets = [0]
+        for i, doc in enumerate(docs):
+            terms = analyze(f"{doc['review_text']}\n{doc['seller_response']}", sp)
+            doc_len[i] = len(terms)
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(i)
+                tfs.append(tf)
+            doc_product[i] = products.setdefault(doc['product_id'], len(products))
+            try:
+                rating = int(round(float(doc['rating'])))
+            except (TypeError, ValueError):
+                rating = 0
+            doc_rating[i] = rating if 0 <= rating <= 5 else 0
+            # Cached: a crawl has few distinct (date, scraped_at) pairs
+            doc_date[i] = parse_review_date(doc['review_date'], doc.get('scraped_at'))
+            store.write(json.dumps(doc, ensure_ascii=False).encode('utf-8') + b'\n')
+            offsets.append(store.tell())
+
+    # Terms sorted by UTF-8 bytes so lookups can binary-search the blob
+    terms = sorted(vocab, key=lambda t: t.encode('utf-8'))
+    rank = np.empty(len(vocab), dtype=np.int64)
+    rank[[vocab[t] for t in terms]] = np.arange(len(terms))
+    t = rank[np.asarray(term_ids, dtype=np.int64)] if term_ids else np.zeros(0, dtype=np.int64)
+    d = np.asarray(doc_ids, dtype=np.int64)
+    f = np.asarray(tfs, dtype=np.int64)
+    order = np.lexsort((d, t))
+    t, d, f = t[order], d[order], f[order]
+
+    term_starts = np.flatnonzero(np.r_[True, t[1:] != t[:-1]]) if len(t) else np.zeros(0, dtype=np.int64)
+    deltas = d.copy()
+    deltas[1:] -= d[:-1]
+    deltas[term_starts] = d[term_starts]
+    streams = {}
+    for name, values in (('doc', deltas), ('tf', f)):
+        data, nbytes = encode_varints(values)
+        per_term = np.add.reduceat(nbytes, term_starts) if len(term_starts) else np.zeros(0, dtype=np.int64)
+        streams[name] = np.concatenate([[0], np.cumsum(per_term)]).astype(np.int64)
+        data.tofile(os.path.join(path, f'{name}.postings'))
+
+    blob = [term.encode('utf-8') for term in terms]
+    with open(os.path.join(path, 'terms.bin'), 'wb') as fh:
+        fh.write(b''.join(blob))
+    np.save(os.path.join(path, 'term_offsets.npy'),
+            np.concatenate([[0], np.cumsum([len(b) for b in blob])]).astype(np.int64))
+    np.save(os.path.join(path, 'doc_offsets.npy'), streams['doc'])
+    np.save(os.path.join(path, 'tf_offsets.npy'), streams['tf'])
+    np.save(os.path.join(path, 'df.npy'), np.diff(np.r_[term_starts, len(t)]).astype(np.int64))
+    np.save(os.path.join(path, 'doc_len.npy'), doc_len)
+    np.save(os.path.join(path, 'doc_product.npy'), doc_product)
+    np.save(os.path.join(path, 'doc_rating.npy'), doc_rating)
+    np.save(os.path.join(path, 'doc_date.npy'), doc_date)
+    np.save(os.path.join(path, 'store_offsets.npy'), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(path, 'segment.json'), 'w', encoding='utf-8') as fh:
+        json.dump({'docs': len(docs), 'total_len': int(doc_len.sum()), 'terms': len(terms),
+                   'products': list(products)}, fh, ensure_ascii=False)
+    return {'docs': len(docs), 'total_len': int(doc_len.sum()), 'terms': len(terms)}
+
+
+class Segment:
+    """Read side of a segment; postings and doc arrays are memory-mapped."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'segment.json'), 'r', encoding='utf-8') as fh:
+            meta = json.load(fh)
+        self.num_docs = meta['docs']
+        self.total_len = meta['total_len']
+        self.products = {pid: i for i, pid in enumerate(meta['products'])}
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode='r')
+        self.term_offsets = load('term_offsets.npy')
+        self.doc_offsets = load('doc_offsets.npy')
+        self.tf_offsets = load('tf_offsets.npy')
+        self.df = load('df.npy')
+        self.doc_len = load('doc_len.npy')
+        self.doc_product = load('doc_product.npy')
+        self.doc_rating = load('doc_rating.npy')
+        self.doc_date = load('doc_date.npy')
+        self.store_offsets = load('store_offsets.npy')
+        self.terms = self._map('terms.bin')
+        self.doc_postings = self._map('doc.postings')
+        self.tf_postings = self._map('tf.postings')
+
+    def _map(self, name):
+        path = os.path.join(self.path, name)
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=np.uint8)
+        return np.memmap(path, dtype=np.uint8, mode='r')
+
+    def _term(self, i):
+        return bytes(self.terms[self.term_offsets[i]:self.term_offsets[i + 1]])
+
+    def lookup(self, term):
+        """Index of term in this segment, or None (binary search over the sorted blob)."""
+        key = term.encode('utf-8')
+        lo, hi = 0, len(self.term_offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.term_offsets) - 1 and self._term(lo) == key:
+            return lo
+        return None
+
+    def postings(self, i):
+        docs = np.cumsum(decode_varints(self.doc_postings[self.doc_offsets[i]:self.doc_offsets[i + 1]]))
+        tfs = decode_varints(self.tf_postings[self.tf_offsets[i]:self.tf_offsets[i + 1]])
+        return docs, tfs
+
+    def document(self, i):
+        with open(os.path.join(self.path, 'docs.jsonl'), 'rb') as fh:
+            fh.seek(int(self.store_offsets[i]))
+            return json.loads(fh.read(int(self.store_offsets[i + 1] - self.store_offsets[i])))
+
+    def iter_documents(self):
+        with open(os.path.join(self.path, 'docs.jsonl'), 'r', encoding='utf-8') as fh:
+            for line in fh:
+                yield json.loads(line)
+
+
+class ReviewIndex:
+    """Segmented BM25 index directory; see the module docstring for the layout."""
+
+    def __init__(self, path='output/review_index', spm_model=None):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.manifest_path = os.path.join(path, 'index.json')
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as fh:
+                self.manifest = json.load(fh)
+            if spm_model and os.path.abspath(spm_model) != self.manifest.get('spm_model'):
+                raise ValueError(f"Index was built with spm_model={self.manifest.get('spm_model')}")
+        else:
+            self.manifest = {'segments': [], 'sources': {}, 'next_segment': 0,
+                             'spm_model': os.path.abspath(spm_model) if spm_model else None}
+        self.sp = None
+        if self.manifest['spm_model']:
+            import sentencepiece as spm
+            self.sp = spm.SentencePieceProcessor()
+            self.sp.load(self.manifest['spm_model'])
+        self._segments = None
+        self._hashes = None
+
+    def _save_manifest(self):
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(self.manifest, fh, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    @property
+    def segments(self):
+        if self._segments is None:
+            self._segments = [Segment(os.path.join(self.path, name)) for name in self.manifest['segments']]
+        return self._segments
+
+    def _known_hashes(self):
+        if self._hashes is None:
+            parts = [np.load(os.path.join(self.path, name, 'hashes.npy')) for name in self.manifest['segments']]
+            self._hashes = np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.uint64)
+        return self._hashes
+
+    def _new_segment(self, docs, hashes=None):
+        name = f"seg_{self.manifest['next_segment']:05d}"
+        self.manifest['next_segment'] += 1
+        info = write_segment(os.path.join(self.path, name), docs, self.sp)
+        if hashes is None:
+            hashes = [review_hash(d['product_id'], d['reviewer_name'], d['review_date'], d['review_text'])
+                      for d in docs]
+        np.save(os.path.join(self.path, name, 'hashes.npy'), np.sort(np.array(hashes, dtype=np.uint64)))
+        self._hashes = None
+        self._segments = None
+        return name, info
+
+    def add_csv(self, paths):
+        """Index rows not seen before from spider CSVs; all new rows go into one new segment."""
+        known = self._known_hashes()
+        batch, batch_hashes = [], {}
+        rows_read = {}
+        skipped = 0
+        for path in paths:
+            key = os.path.abspath(path)
+            already = self.manifest['sources'].get(key, 0)
+            with open(path, 'r', encoding='utf-8', newline='') as fh:
+                n = 0
+                for n, row in enumerate(csv.DictReader(fh), 1):
+                    if n <= already:
+                        continue
+                    doc = _doc_from_row(row, os.path.basename(path))
+                    if doc['review_text'] in PLACEHOLDER_TEXTS and not doc['seller_response']:
+                        skipped += 1
+                        continue
+                    h = review_hash(doc['product_id'], doc['reviewer_name'], doc['review_date'], doc['review_text'])
+                    i = np.searchsorted(known, np.uint64(h))
+                    if h in batch_hashes or (i < len(known) and known[i] == h):
+                        skipped += 1
+                        continue
+                    batch_hashes[h] = None
+                    batch.append(doc)
+            rows_read[key] = max(n, already)
+
+        info = {'docs': 0}
+        if batch:
+            name, info = self._new_segment(batch, list(batch_hashes))
+            self.manifest['segments'].append(name)
+        self.manifest['sources'].update(rows_read)
+        self._save_manifest()
+        return {'indexed': len(batch), 'skipped': skipped, 'terms': info.get('terms', 0)}
+
+    def merge(self):
+        """Rewrite all segments as one (fewer segments, faster queries)."""
+        if len(self.manifest['segments']) < 2:
+            return
+        old = list(self.manifest['segments'])
+        docs = [doc for seg in self.segments for doc in seg.iter_documents()]
+        name, _ = self._new_segment(docs)
+        self.manifest['segments'] = [name]
+        self._save_manifest()
+        for seg_name in old:
+            seg_path = os.path.join(self.path, seg_name)
+            for fname in os.listdir(seg_path):
+                os.remove(os.path.join(seg_path, fname))
+            os.rmdir(seg_path)
+
+    def stats(self):
+        return {
+            'segments': len(self.segments),
+            'docs': sum(s.num_docs for s in self.segments),
+            'sources': len(self.manifest['sources']),
+            'spm_model': self.manifest['spm_model'],
+        }
+
+    def search(self, query, k=10, product=None, min_rating=None, max_rating=None, since=None, until=None):
+        """BM25 top-k. since/until are 'YYYY-MM-DD'; reviews without a parseable date fail date filters."""
+        terms = list(dict.fromkeys(analyze(query, self.sp)))
+        segments = self.segments
+        if not terms or not segments:
+            return []
+        num_docs = sum(s.num_docs for s in segments)
+        avgdl = max(sum(s.total_len for s in segments) / max(num_docs, 1), 1e-9)
+
+        # Global df so scores are comparable across segments
+        found = [[seg.lookup(term) for term in terms] for seg in segments]
+        df = np.zeros(len(terms), dtype=np.int64)
+        for seg, ids in zip(segments, found):
+            for j, i in enumerate(ids):
+                if i is not None:
+                    df[j] += seg.df[i]
+        idf = np.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+        since_day = to_day(since) if since else None
+        until_day = to_day(until) if until else None
+
+        hits = []
+        for s, (seg, ids) in enumerate(zip(segments, found)):
+            doc_parts, score_parts = [], []
+            for j, i in enumerate(ids):
+                if i is None:
+                    continue
+                docs, tfs = seg.postings(i)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * seg.doc_len[docs] / avgdl)
+                doc_parts.append(docs)
+                score_parts.append(idf[j] * tfs * (BM25_K1 + 1) / (tfs + norm))
+            if not doc_parts:
+                continue
+            docs, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+
+            keep = np.ones(len(docs), dtype=bool)
+            if product is not None:
+                p = seg.products.get(product)
+                if p is None:
+                    continue
+                keep &= seg.doc_product[docs] == p
+            if min_rating is not None:
+                keep &= seg.doc_rating[docs] >= min_rating
+            if max_rating is not None:
+                keep &= (seg.doc_rating[docs] <= max_rating) & (seg.doc_rating[docs] > 0)
+            if since_day is not None:
+                keep &= seg.doc_date[docs] >= since_day
+            if until_day is not None:
+                keep &= (seg.doc_date[docs] <= until_day) & (seg.doc_date[docs] != NO_DATE)
+            docs, scores = docs[keep], scores[keep]
+            if len(docs) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                docs, scores = docs[top], scores[top]
+            hits.extend((float(score), s, int(doc)) for score, doc in zip(scores, docs))
+
+        hits.sort(key=lambda h: -h[0])
+        return [dict(segments[s].document(doc), score=round(score, 4)) for score, s, doc in hits[:k]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Full-text search over scraped reviews')
+    parser.add_argument('--index', default='output/review_index')
+    parser.add_argument('--spm-model', default=None, help='ne_spm.model; only when creating the index')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    add = sub.add_parser('add', help='index new rows from spider CSVs as a new segment')
+    add.add_argument('csv_files', nargs='+')
+
+    search = sub.add_parser('search')
+    search.add_argument('query')
+    search.add_argument('-k', type=int, default=10)
+    search.add_argument('--product', default=None, help='product_id')
+    search.add_argument('--min-rating', type=int, default=None)
+    search.add_argument('--max-rating', type=int, default=None)
+    search.add_argument('--since', default=None, help='YYYY-MM-DD')
+    search.add_argument('--until', default=None, help='YYYY-MM-DD')
+
+    sub.add_parser('merge', help='merge all segments into one')
+    sub.add_parser('stats')
+    args = parser.parse_args()
+
+    index = ReviewIndex(args.index, args.spm_model)
+    if args.command == 'add':
+        start = time.time()
+        result = index.add_csv(args.csv_files)
+        print(f"Indexed {result['indexed']:,} reviews ({result['skipped']:,} skipped, "
+              f"{result['terms']:,} terms) in {time.time() - start:.1f}s")
+    elif args.command == 'search':
+        start = time.perf_counter()
+        hits = index.search(args.query, args.k, args.product, args.min_rating, args.max_rating,
+                            args.since, args.until)
+        elapsed = (time.perf_counter() - start) * 1000
+        for i, hit in enumerate(hits, 1):
+            print(f"{i:>3}. [{hit['score']:.2f}] {hit['product_id']} ★{hit['rating'] or '-'} {hit['review_date']}")
+            print(f"     {hit['review_text'][:200]}")
+            if hit['seller_response']:
+                print(f"     ↳ {hit['seller_response'][:200]}")
+        print(f"({len(hits)} results in {elapsed:.1f} ms)")
+    elif args.command == 'merge':
+        index.merge()
+        print(f"Index: {index.stats()}")
+    else:
+        print(json.dumps(index.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
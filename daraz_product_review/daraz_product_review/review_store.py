@@ -0,0 +1,437 @@
+"""
+Incremental per-product and per-keyword review aggregates.
+
+The spider feeds every scraped review in as it goes, and the offline loader
+replays old output/daraz_products_*.csv files. Reports then query this
+store instead of rescanning raw CSVs.
+
+Run: python -m daraz_product_review.review_store load output/daraz_products_*.csv --keyword oven
+     python -m daraz_product_review.review_store top -n 20 --by avg_rating --keyword oven
+
+Counters live in NumPy arrays indexed by product row. Reviews are
+identified by a 64-bit hash of (product_id, reviewer, date, text): the
+spider's review_id is only a position on the page and shifts when new
+reviews arrive. Feeding the same review again is a no-op. If a re-scrape
+changes its rating, verified flag or seller response, the counters are
+moved rather than double counted. Keyword stats are sums over the products
+seen under that keyword, so a product found by two searches is counted
+once per keyword.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+
+# Star histogram buckets: 0 = no stars parsed, 1..5 = stars
+STARS = 6
+SORT_KEYS = ('avg_rating', 'reviews', 'verified_share', 'response_rate', 'last_seen')
+PLACEHOLDER_TEXTS = {'', 'No review text'}
+# Recent review hashes are folded into the sorted array once the dict reaches this size
+COMPACT_EVERY = 100_000
+
+
+def product_id_from_url(url):
+    """Same id parse_product derives: last path segment without .html"""
+    return url.split('?')[0].rstrip('/').split('/')[-1].split('.html')[0]
+
+
+def review_hash(product_id, reviewer_name, review_date, review_text):
+    key = '\x1f'.join(str(v or '').strip() for v in (product_id, reviewer_name, review_date, review_text))
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _grow(array, size):
+    if size <= len(array):
+        return array
+    grown = np.zeros((max(size, 2 * len(array), 64),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def _parse_rating(value):
+    try:
+        rating = int(round(float(value)))
+    except (TypeError, ValueError):
+        return 0
+    return rating if 0 <= rating < STARS else 0
+
+
+@lru_cache(maxsize=4096)
+def _parse_timestamp(value):
+    # scraped_at repeats across a product's reviews, so most calls hit the cache
+    try:
+        return time.mktime(time.strptime(value, '%Y-%m-%d %H:%M:%S'))
+    except ValueError:
+        return None
+
+
+def _parse_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', '1', 'yes')
+    return bool(value)
+
+
+class ReviewAggregateStore:
+    """Array-backed running stats per product and keyword, with idempotent review updates"""
+
+    def __init__(self, path=None, save_every=500, stats=None):
+        self.path = path
+        self.save_every = save_every
+        self.stats = stats
+        self.unsaved = 0
+
+        # Products: id -> row; per-row counters in parallel arrays
+        self.product_index = {}
+        self.product_ids = []
+        self.product_names = []
+        self.review_count = np.zeros(0, dtype=np.int64)
+        self.star_hist = np.zeros((0, STARS), dtype=np.int64)
+        self.verified = np.zeros(0, dtype=np.int64)
+        self.responded = np.zeros(0, dtype=np.int64)
+        self.last_seen = np.zeros(0, dtype=np.float64)
+
+        # Keywords: name -> index, plus (keyword, product) membership pairs
+        self.keyword_index = {}
+        self.keywords = []
+        self.memberships = set()
+
+        # Reviews: a sorted hash array for the saved bulk plus a dict for recent additions
+        self.review_hashes = np.zeros(0, dtype=np.uint64)
+        self.review_rows = np.zeros(0, dtype=np.int64)
+        self.recent = {}
+        self.review_product = np.zeros(0, dtype=np.int32)
+        self.review_rating = np.zeros(0, dtype=np.int8)
+        self.review_flags = np.zeros(0, dtype=np.int8)  # bit 0 verified, bit 1 seller responded
+        self.num_reviews = 0
+
+        if path and os.path.exists(os.path.join(path, 'arrays.npz')):
+            self.load(path)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            path=settings.get('REVIEW_STORE_DIR', 'output/review_store'),
+            save_every=settings.getint('REVIEW_STORE_SAVE_EVERY', 500),
+            stats=crawler.stats,
+        )
+
+    def count(self, key, value=1):
+        if self.stats is not None:
+            self.stats.inc_value(f'review_store/{key}', value)
+
+    # -- ingest ---------------------------------------------------------------
+
+    def _product_row(self, product_id, product_name=None):
+        row = self.product_index.get(product_id)
+        if row is None:
+            row = len(self.product_ids)
+            self.product_index[product_id] = row
+            self.product_ids.append(product_id)
+            self.product_names.append(product_name or '')
+            size = row + 1
+            self.review_count = _grow(self.review_count, size)
+            self.star_hist = _grow(self.star_hist, size)
+            self.verified = _grow(self.verified, size)
+            self.responded = _grow(self.responded, size)
+            self.last_seen = _grow(self.last_seen, size)
+        elif product_name and not self.product_names[row]:
+            self.product_names[row] = product_name
+        return row
+
+    def _find_review(self, h):
+        row = self.recent.get(h)
+        if row is not None:
+            return row
+        i = int(np.searchsorted(self.review_hashes, np.uint64(h)))
+        if i < len(self.review_hashes) and self.review_hashes[i] == h:
+            return int(self.review_rows[i])
+        return None
+
+    def _apply(self, product, rating, flags, sign):
+        self.star_hist[product, rating] += sign
+        self.verified[product] += sign * (flags & 1)
+        self.responded[product] += sign * ((flags >> 1) & 1)
+
+    def add_review(self, product_id, review, product_name=None, keyword=None, seen_at=None):
+        """Fold one review dict (spider/CSV field names) in. Returns 'new', 'updated', 'duplicate' or 'skipped'."""
+        if not product_id:
+            self.count('skipped')
+            return 'skipped'
+        text = (review.get('review_text') or '').strip()
+        # Rating-only reviews still count; both placeholder forms hash alike so re-scrapes dedupe
+        if text in PLACEHOLDER_TEXTS:
+            text = ''
+
+        product = self._product_row(product_id, product_name)
+        if keyword:
+            kw = self.keyword_index.setdefault(keyword, len(self.keywords))
+            if kw == len(self.keywords):
+                self.keywords.append(keyword)
+            self.memberships.add((kw, product))
+        self.last_seen[product] = max(self.last_seen[product], seen_at or time.time())
+
+        rating = _parse_rating(review.get('review_rating'))
+        flags = int(_parse_bool(review.get('verified_purchase'))) | \
+            (int(bool((review.get('seller_response') or '').strip())) << 1)
+        h = review_hash(product_id, review.get('reviewer_name'), review.get('review_date'), text)
+
+        row = self._find_review(h)
+        if row is None:
+            row = self.num_reviews
+            self.num_reviews += 1
+            self.review_product = _grow(self.review_product, self.num_reviews)
+            self.review_rating = _grow(self.review_rating, self.num_reviews)
+            self.review_flags = _grow(self.review_flags, self.num_reviews)
+            self.review_product[row] = product
+            self.review_rating[row] = rating
+            self.review_flags[row] = flags
+            self.recent[h] = row
+            if len(self.recent) >= COMPACT_EVERY:
+                self._compact()
+            self.review_count[product] += 1
+            self._apply(product, rating, flags, 1)
+            result = 'new'
+        else:
+            old_rating, old_flags = int(self.review_rating[row]), int(self.review_flags[row])
+            # A re-scrape only upgrades: a missing star row or reply in one scrape is a parse miss
+            rating = rating or old_rating
+            flags |= old_flags
+            if (rating, flags) == (old_rating, old_flags):
+                self.count('duplicate')
+                return 'duplicate'
+            self._apply(product, old_rating, old_flags, -1)
+            self._apply(product, rating, flags, 1)
+            self.review_rating[row] = rating
+            self.review_flags[row] = flags
+            result = 'updated'
+
+        self.count(result)
+        self.unsaved += 1
+        if self.path and self.save_every and self.unsaved >= self.save_every:
+            self.save()
+        return result
+
+    def load_csv(self, path, keyword=None):
+        """Replay a spider output CSV (or product_reviews.csv). Returns counts per add_review result."""
+        results = {'new': 0, 'updated': 0, 'duplicate': 0, 'skipped': 0}
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                url = row.get('product_url') or row.get('Product URL') or ''
+                product_id = row.get('product_id') or (product_id_from_url(url) if url else '')
+                review = {
+                    'review_text': row.get('review_text', row.get('Review Text')),
+                    'review_rating': row.get('review_rating', row.get('Review Rating')),
+                    'review_date': row.get('review_date', row.get('Review Date')),
+                    'reviewer_name': row.get('reviewer_name'),
+                    'verified_purchase': row.get('verified_purchase'),
+                    'seller_response': row.get('seller_response'),
+                }
+                seen_at = _parse_timestamp(row['scraped_at']) if row.get('scraped_at') else None
+                name = row.get('product_name') or row.get('Product Name')
+                results[self.add_review(product_id, review, name, keyword, seen_at)] += 1
+        return results
+
+    # -- queries ----------------------------------------------------------------
+
+    def _columns(self, rows=None):
+        n = len(self.product_ids)
+        hist = self.star_hist[:n] if rows is None else self.star_hist[rows]
+        rated = hist[:, 1:].sum(axis=1)
+        star_sum = hist[:, 1:] @ np.arange(1, STARS)
+        reviews = self.review_count[:n] if rows is None else self.review_count[rows]
+        verified = self.verified[:n] if rows is None else self.verified[rows]
+        responded = self.responded[:n] if rows is None else self.responded[rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return {
+                'reviews': reviews,
+                'rated': rated,
+                'avg_rating': np.where(rated > 0, star_sum / np.maximum(rated, 1), np.nan),
+                'verified_share': np.where(reviews > 0, verified / np.maximum(reviews, 1), np.nan),
+                'response_rate': np.where(reviews > 0, responded / np.maximum(reviews, 1), np.nan),
+                'last_seen': self.last_seen[:n] if rows is None else self.last_seen[rows],
+            }
+
+    def _keyword_rows(self, keyword):
+        kw = self.keyword_index.get(keyword)
+        if kw is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.fromiter(sorted(p for k, p in self.memberships if k == kw), dtype=np.int64)
+
+    def _product_dict(self, row, cols, i):
+        return {
+            'product_id': self.product_ids[row],
+            'product_name': self.product_names[row],
+            'reviews': int(cols['reviews'][i]),
+            'avg_rating': None if np.isnan(cols['avg_rating'][i]) else round(float(cols['avg_rating'][i]), 3),
+            'star_histogram': self.star_hist[row, 1:].tolist(),
+            'verified_share': None if np.isnan(cols['verified_share'][i]) else round(float(cols['verified_share'][i]), 3),
+            'response_rate': None if np.isnan(cols['response_rate'][i]) else round(float(cols['response_rate'][i]), 3),
+            'last_seen': float(cols['last_seen'][i]),
+        }
+
+    def top_products(self, n=10, by='avg_rating', keyword=None, min_reviews=1):
+        """Top-n products by one of SORT_KEYS, optionally within a keyword and above a review floor"""
+        if by not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{by}', expected one of {SORT_KEYS}")
+        rows = self._keyword_rows(keyword) if keyword is not None else np.arange(len(self.product_ids))
+        cols = self._columns(rows)
+        candidates = np.flatnonzero((cols['reviews'] >= min_reviews) & ~np.isnan(cols[by]))
+        if not len(candidates):
+            return []
+        # Ties on the main key go to the product with more reviews
+        score = cols[by][candidates]
+        if len(candidates) > n:
+            keep = np.argpartition(-score, n - 1)[:n]
+            candidates, score = candidates[keep], score[keep]
+        order = np.lexsort((-cols['reviews'][candidates], -score))
+        return [self._product_dict(int(rows[i]), cols, i) for i in candidates[order]]
+
+    def product(self, product_id):
+        row = self.product_index.get(product_id)
+        if row is None:
+            return None
+        return self._product_dict(row, self._columns(np.array([row])), 0)
+
+    def keyword_summary(self, keyword):
+        rows = self._keyword_rows(keyword)
+        if not len(rows):
+            return None
+        hist = self.star_hist[rows].sum(axis=0)
+        reviews = int(self.review_count[rows].sum())
+        rated = int(hist[1:].sum())
+        return {
+            'keyword': keyword,
+            'products': len(rows),
+            'reviews': reviews,
+            'avg_rating': round(float(hist[1:] @ np.arange(1, STARS) / rated), 3) if rated else None,
+            'star_histogram': hist[1:].tolist(),
+            'verified_share': round(float(self.verified[rows].sum() / reviews), 3) if reviews else None,
+            'response_rate': round(float(self.responded[rows].sum() / reviews), 3) if reviews else None,
+        }
+
+    def summary(self):
+        return {
+            'products': len(self.product_ids),
+            'reviews': self.num_reviews,
+            'keywords': len(self.keywords),
+        }
+
+    # -- persistence --------------------------------------------------------------
+
+    def _compact(self):
+        """Merge recently added review hashes into the sorted array"""
+        if not self.recent:
+            return
+        hashes = np.concatenate([self.review_hashes, np.fromiter(self.recent.keys(), dtype=np.uint64,
+                                                                 count=len(self.recent))])
+        rows = np.concatenate([self.review_rows, np.fromiter(self.recent.values(), dtype=np.int64,
+                                                             count=len(self.recent))])
+        order = np.argsort(hashes, kind='stable')
+        self.review_hashes, self.review_rows = hashes[order], rows[order]
+        self.recent = {}
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            raise ValueError("No store directory configured")
+        os.makedirs(path, exist_ok=True)
+        self._compact()
+        n, r = len(self.product_ids), self.num_reviews
+        tmp = os.path.join(path, 'arrays.tmp.npz')
+        meta = {'product_ids': self.product_ids, 'product_names': self.product_names, 'keywords': self.keywords}
+        # The product/keyword index travels inside the npz, so one os.replace swaps the whole store
+        meta_bytes = np.frombuffer(json.dumps(meta, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+        np.savez(tmp, meta=meta_bytes, review_count=self.review_count[:n], star_hist=self.star_hist[:n], verified=self.verified[:n],
+                 responded=self.responded[:n], last_seen=self.last_seen[:n], review_hashes=self.review_hashes,
+                 review_rows=self.review_rows, review_product=self.review_product[:r],
+                 review_rating=self.review_rating[:r], review_flags=self.review_flags[:r],
+                 memberships=np.array(sorted(self.memberships), dtype=np.int64).reshape(-1, 2))
+        os.replace(tmp, os.path.join(path, 'arrays.npz'))
+        legacy_meta = os.path.join(path, 'meta.json')
+        if os.path.exists(legacy_meta):
+            os.remove(legacy_meta)
+        self.unsaved = 0
+        self.count('saves')
+
+    def load(self, path):
+        with np.load(os.path.join(path, 'arrays.npz')) as data:
+            if 'meta' in data:
+                meta = json.loads(data['meta'].tobytes().decode('utf-8'))
+            else:
+                # Stores saved before the index moved into the npz
+                with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+            self.review_count = data['review_count']
+            self.star_hist = data['star_hist']
+            self.verified = data['verified']
+            self.responded = data['responded']
+            self.last_seen = data['last_seen']
+            self.review_hashes = data['review_hashes']
+            self.review_rows = data['review_rows']
+            self.review_product = data['review_product']
+            self.review_rating = data['review_rating']
+            self.review_flags = data['review_flags']
+            self.memberships = {(int(k), int(p)) for k, p in data['memberships']}
+        self.product_ids = meta['product_ids']
+        self.product_names = meta['product_names']
+        self.product_index = {pid: i for i, pid in enumerate(self.product_ids)}
+        self.keywords = meta['keywords']
+        self.keyword_index = {kw: i for i, kw in enumerate(self.keywords)}
+        self.num_reviews = len(self.review_product)
+        self.recent = {}
+
+    def close(self):
+        if self.path and self.unsaved:
+            self.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-product review aggregate store')
+    parser.add_argument('--store', default='output/review_store')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    load = sub.add_parser('load', help='replay review CSVs into the store')
+    load.add_argument('csv_files', nargs='+')
+    load.add_argument('--keyword', default=None, help='search keyword these files were scraped for')
+
+    top = sub.add_parser('top', help='top-N products')
+    top.add_argument('-n', type=int, default=10)
+    top.add_argument('--by', choices=SORT_KEYS, default='avg_rating')
+    top.add_argument('--keyword', default=None)
+    top.add_argument('--min-reviews', type=int, default=1)
+
+    show = sub.add_parser('show', help='stats for one product or keyword')
+    show.add_argument('--product', default=None)
+    show.add_argument('--keyword', default=None)
+    args = parser.parse_args()
+
+    store = ReviewAggregateStore(args.store, save_every=0)
+    if args.command == 'load':
+        for path in args.csv_files:
+            start = time.time()
+            results = store.load_csv(path, args.keyword)
+            print(f"{path}: " + ", ".join(f"{k}={v}" for k, v in results.items()) + f" ({time.time() - start:.1f}s)")
+        store.save()
+        print(f"Store: {store.summary()}")
+    elif args.command == 'top':
+        start = time.perf_counter()
+        rows = store.top_products(args.n, args.by, args.keyword, args.min_reviews)
+        elapsed = (time.perf_counter() - start) * 1000
+        for i, p in enumerate(rows, 1):
+            print(f"{i:>3}. {p['product_id']:<30} {p['reviews']:>6} reviews  avg {p['avg_rating']}  "
+                  f"verified {p['verified_share']}  replied {p['response_rate']}  {p['product_name'][:50]}")
+        print(f"({elapsed:.1f} ms)")
+    else:
+        result = store.product(args.product) if args.product else store.keyword_summary(args.keyword)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
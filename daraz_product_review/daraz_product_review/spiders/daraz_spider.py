@@ -5,7 +5,15 @@ import time
 import json
 import os
 import csv
+import math
 from datetime import datetime
+from urllib.parse import parse_qs, urlparse
+
+from daraz_product_review import browser_service
+from daraz_product_review.debug_capture import DebugCapture
+from daraz_product_review.retry_policy import RetryPolicy
+from daraz_product_review.language_tagger import LanguageTagger
+from daraz_product_review.review_store import PLACEHOLDER_TEXTS, ReviewAggregateStore, product_id_from_url
 
 class DarazDetailedSpider(scrapy.Spider):
     name = 'daraz'
@@ -24,6 +32,7 @@ class DarazDetailedSpider(scrapy.Spider):
         self.start_time = datetime.now()
         self.processed_products = 0
         self.failed_products = 0
+        self.skipped_products = 0
         self.total_products = 0
 
         # Log file for detailed steps
@@ -39,6 +48,26 @@ class DarazDetailedSpider(scrapy.Spider):
 
         self.log_step("🚀 SPIDER INITIALIZATION", "Spider started successfully")
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.retry_policy = RetryPolicy.from_crawler(crawler)
+        spider.debug_capture = DebugCapture.from_crawler(crawler)
+        spider.review_store = ReviewAggregateStore.from_crawler(crawler)
+        spider.language_tagger = LanguageTagger.from_crawler(crawler)
+        return spider
+
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        # Attach to the long-lived browser service if it is up, otherwise launch in-process
+        cdp_url = settings.get('BROWSER_SERVICE_CDP_URL')
+        if cdp_url:
+            if browser_service.is_available(cdp_url):
+                settings.set('PLAYWRIGHT_CDP_URL', cdp_url, priority='spider')
+            else:
+                print(f"⚠️ Browser service not reachable at {cdp_url}, launching Chromium in-process")
+
     def init_csv(self):
         """Initialize CSV file with headers"""
         try:
@@ -48,7 +77,7 @@ class DarazDetailedSpider(scrapy.Spider):
                 'review_id', 'review_text', 'review_rating', 'review_date',
                 'reviewer_name', 'verified_purchase', 'review_likes',
                 'seller_response', 'response_date', 'response_likes',
-                'scraped_at', 'review_images', 'product_specs'
+                'scraped_at', 'review_images', 'product_specs', 'review_language'
             ]
             self.csv_writer = csv.DictWriter(self.csv_file, fieldnames=fieldnames)
             self.csv_writer.writeheader()
@@ -74,7 +103,9 @@ class DarazDetailedSpider(scrapy.Spider):
                 '--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
             ]
         },
-        'PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT': 300000,
+        # Set to e.g. http://127.0.0.1:9222 to reuse `python -m daraz_product_review.browser_service`
+        'BROWSER_SERVICE_CDP_URL': None,
+        'PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT': 60000,
         'PLAYWRIGHT_CONTEXT_ARGS': {
             'viewport': {'width': 1920, 'height': 1080},
             'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -87,8 +118,36 @@ class DarazDetailedSpider(scrapy.Spider):
         'RANDOMIZE_DOWNLOAD_DELAY': True,
         'CONCURRENT_REQUESTS': 8,
         'CONCURRENT_REQUESTS_PER_DOMAIN': 8,
-        'RETRY_TIMES': 3,  # Increased retry attempts
-        'RETRY_HTTP_CODES': [500, 502, 503, 504, 408, 429, 403, 404],
+        # Retries are handled per error class by PolicyRetryMiddleware
+        'DOWNLOADER_MIDDLEWARES': {
+            'scrapy.downloadermiddlewares.retry.RetryMiddleware': None,
+            'daraz_product_review.middlewares.PolicyRetryMiddleware': 550,
+        },
+        'RETRY_POLICY_BUDGETS': {'permanent': 0, 'transient': 3, 'block': 2},
+        'RETRY_POLICY_BACKOFF_BASE': 2.0,
+        'RETRY_POLICY_BACKOFF_MAX': 60.0,
+        'CIRCUIT_BREAKER_WINDOW': 20,
+        'CIRCUIT_BREAKER_THRESHOLD': 0.5,
+        'CIRCUIT_BREAKER_COOLDOWN': 120,
+        'REVIEWS_SECTION_ATTEMPTS': 2,
+        'REVIEWS_SECTION_TIMEOUT': 15000,
+        # Listing cards show review counts; products below the threshold are dropped or deprioritized
+        'MIN_LISTING_REVIEWS': 1,
+        'LISTING_BELOW_THRESHOLD': 'drop',  # or 'deprioritize'
+        'REVIEWS_PER_SCROLL': 5,
+        # Debug snapshots: always on the listed failure triggers, sampled otherwise, capped per run
+        'DEBUG_CAPTURE_DIR': 'debug',
+        'DEBUG_CAPTURE_SAMPLE_RATE': 0.0,
+        'DEBUG_CAPTURE_TRIGGERS': ['review_extraction_error', 'product_parsing_error', 'reviews_section_missing'],
+        'DEBUG_CAPTURE_MAX_HTML_BYTES': 256 * 1024,
+        'DEBUG_CAPTURE_QUOTA': 50,
+        # Running per-product/per-keyword review stats, saved every N changed reviews and on close
+        'REVIEW_STORE_DIR': 'output/review_store',
+        'REVIEW_STORE_SAVE_EVERY': 500,
+        # Script-ratio language tags; only undecided Latin-script reviews reach langdetect
+        'LANGUAGE_TAGGER_NE_THRESHOLD': 0.8,
+        'LANGUAGE_TAGGER_SLOW_DETECTOR': 'langdetect',
+        'LANGUAGE_TAGGER_CACHE_SIZE': 100_000,
         'LOG_LEVEL': 'INFO',
     }
 
@@ -143,14 +202,8 @@ class DarazDetailedSpider(scrapy.Spider):
         """Parse homepage to find product links"""
         page = response.meta.get('playwright_page')
 
-        if page:
-            # Take a screenshot for debugging
-            await page.screenshot(path='debug_screenshot.png')
-
-            # Log the page content for debugging
-            content = await page.content()
-            with open('page_content.html', 'w', encoding='utf-8') as f:
-                f.write(content)
+        # Sampled snapshot of the catalog page for debugging
+        await self.debug_capture.maybe_capture(page, response.request, 'catalog')
 
         self.log_step("📄 HOMEPAGE LOADED", f"Successfully loaded: {response.url}", {
             'status_code': response.status,
@@ -174,23 +227,49 @@ class DarazDetailedSpider(scrapy.Spider):
                 self.log_step("🔍 SELECTOR SUCCESS", f"Selector '{selector}' found {len(links)} links")
                 all_product_links.extend(links)
 
-        unique_links = list(set(link for link in all_product_links if link and 'daraz.com.np' in response.urljoin(link) and '/products/' in response.urljoin(link)))
-        self.total_products = len(unique_links)
-        self.log_step("🛍️ PRODUCT LINKS PROCESSED", f"Found {self.total_products} unique product links")
+        unique_links = list(dict.fromkeys(
+            self.normalize_product_url(link) for link in all_product_links
+            if link and 'daraz.com.np' in response.urljoin(link) and '/products/' in response.urljoin(link)
+        ))
+
+        # Review count, rating and price from the catalog cards, keyed by product URL
+        listings = self.extract_listing_metadata(response)
+        self.log_step("🏷️ LISTING METADATA", f"Parsed metadata for {len(listings)} catalog cards")
+
+        # Search keyword (?q=oven) the products were found under, for the review store
+        keyword = (parse_qs(urlparse(response.url).query).get('q') or [None])[0]
+
+        min_reviews = self.settings.getint('MIN_LISTING_REVIEWS', 1)
+        below_threshold = self.settings.get('LISTING_BELOW_THRESHOLD', 'drop')
+
+        queued = []
+        for product_url in unique_links:
+            listing = listings.get(product_url, {})
+            review_count = listing.get('review_count')
+            # Unknown counts (card not parsed or no rating markup) are never dropped
+            if review_count is not None and review_count < min_reviews:
+                if below_threshold == 'drop':
+                    self.skipped_products += 1
+                    self.log_step("⏭️ SKIPPING PRODUCT", f"{review_count} reviews < {min_reviews}: {product_url[:100]}...")
+                    continue
+                priority = -1
+            else:
+                priority = review_count or 0
+            queued.append((product_url, listing, priority))
+
+        self.total_products = len(queued)
+        self.log_step("🛍️ PRODUCT LINKS PROCESSED", f"Found {len(unique_links)} unique product links, "
+                                                    f"queuing {self.total_products} ({self.skipped_products} skipped)")
 
         # Process all products
-        for i, product_url in enumerate(unique_links):
-            # Ensure the URL has the correct scheme
-            if product_url.startswith('//'):
-                product_url = f'https:{product_url}'
-            elif product_url.startswith('/'):
-                product_url = f'https://www.daraz.com.np{product_url}'
-
-            self.log_step("🎯 QUEUING PRODUCT", f"Product {i+1}/{self.total_products}: {product_url[:100]}...")
+        for i, (product_url, listing, priority) in enumerate(queued):
+            self.log_step("🎯 QUEUING PRODUCT", f"Product {i+1}/{self.total_products}: {product_url[:100]}...",
+                          listing or None)
 
             yield Request(
                 url=product_url,
                 callback=self.parse_product,
+                priority=priority,
                 meta={
                     'playwright': True,
                     'playwright_include_page': True,
@@ -199,6 +278,8 @@ class DarazDetailedSpider(scrapy.Spider):
                     ],
                     'product_number': i + 1,
                     'total_products': self.total_products,
+                    'listing': listing,
+                    'keyword': keyword,
                 },
                 dont_filter=True,
                 errback=self.handle_error
@@ -207,12 +288,47 @@ class DarazDetailedSpider(scrapy.Spider):
         if page:
             await page.close()
 
+    def normalize_product_url(self, url):
+        """Ensure the URL has the correct scheme and host"""
+        if url.startswith('//'):
+            return f'https:{url}'
+        if url.startswith('/'):
+            return f'https://www.daraz.com.np{url}'
+        return url
+
+    def extract_listing_metadata(self, response):
+        """Extract review count and price from each catalog card"""
+        listings = {}
+        for card in response.css('div[data-qa-locator="product-item"]'):
+            link = card.css('a[href*="/products/"]::attr(href)').get()
+            if not link:
+                continue
+
+            # Review count is rendered as "(12)"; fetcher.py reads the same from span.rating__review.
+            # Cards without rating markup stay None (unknown) so the review threshold never drops them.
+            review_count = None
+            for text in card.css('span.rating__review::text, span::text').getall():
+                match = re.fullmatch(r'\((\d+)\)', text.strip())
+                if match:
+                    review_count = int(match.group(1))
+                    break
+
+            price = next((p.strip() for p in card.css('span::text').getall() if 'Rs' in p), None)
+
+            listings[self.normalize_product_url(link)] = {
+                'item_id': card.attrib.get('data-item-id'),
+                'review_count': review_count,
+                'price': price,
+            }
+        return listings
+
     async def parse_product(self, response):
         """Parse individual product page with enhanced review extraction"""
         page = response.meta.get('playwright_page')
         product_number = response.meta.get('product_number', 'unknown')
         total_products = response.meta.get('total_products', 'unknown')
-        product_id = response.url.split('/')[-1].split('.html')[0]
+        product_id = product_id_from_url(response.url)
+        listing = response.meta.get('listing') or {}
 
         self.log_step("🛍️ PRODUCT PAGE LOADED", f"Product #{product_number}/{total_products}: {response.url[:100]}...")
 
@@ -221,10 +337,19 @@ class DarazDetailedSpider(scrapy.Spider):
                 # Extract basic product info
                 product_name = self.extract_product_name(response)
                 product_price = self.extract_product_price(response)
+                if product_price == "Not found" and listing.get('price'):
+                    product_price = listing['price']
                 product_rating = self.extract_product_rating(response)
 
                 # Extract all reviews with metadata
-                reviews_data = await self.extract_reviews_enhanced(response, page, product_id)
+                reviews_data = await self.extract_reviews_enhanced(response, page, product_id,
+                                                                   listing.get('review_count'))
+
+                # Tag the whole product's reviews in one batch
+                texts = [review.get('review_text', '') for review in reviews_data]
+                languages = self.language_tagger.tag_batch(texts)
+                for review, language in zip(reviews_data, languages):
+                    review['review_language'] = '' if review.get('review_text', '') in PLACEHOLDER_TEXTS else language
 
                 # Save each review as a separate row in CSV
                 for review in reviews_data:
@@ -245,8 +370,10 @@ class DarazDetailedSpider(scrapy.Spider):
                         'response_likes': review.get('response_likes', 0),
                         'scraped_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                         'review_images': '|'.join(review.get('review_images', []) if review.get('review_images') else []),
-                        'product_specs': review.get('product_specs', '')
+                        'product_specs': review.get('product_specs', ''),
+                        'review_language': review['review_language'],
                     })
+                    self.review_store.add_review(product_id, review, product_name, response.meta.get('keyword'))
 
                 self.processed_products += 1
                 self.log_step("📊 PROGRESS", 
@@ -259,6 +386,7 @@ class DarazDetailedSpider(scrapy.Spider):
                     'price': product_price,
                     'rating': product_rating,
                     'reviews_count': len(reviews_data),
+                    'listing_review_count': listing.get('review_count'),
                     'reviews': reviews_data,
                     'scraped_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                     'product_number': product_number,
@@ -267,11 +395,13 @@ class DarazDetailedSpider(scrapy.Spider):
             except Exception as e:
                 self.failed_products += 1
                 self.log_step("❌ PRODUCT PARSING ERROR", f"Failed to parse product: {e}")
+                await self.debug_capture.maybe_capture(page, response.request, 'product',
+                                                       trigger='product_parsing_error')
             finally:
                 if page:
                     await page.close()
 
-    async def extract_reviews_enhanced(self, response, page, product_id):
+    async def extract_reviews_enhanced(self, response, page, product_id, expected_reviews=None):
         """Enhanced review extraction with all metadata and proper waiting"""
         reviews_data = []
         
@@ -279,30 +409,40 @@ class DarazDetailedSpider(scrapy.Spider):
             self.log_step("⚠️ NO PAGE OBJECT", "Cannot extract reviews without browser page")
             return reviews_data
 
+        if expected_reviews == 0:
+            self.log_step("⏭️ NO REVIEWS EXPECTED", "Listing shows 0 reviews, skipping review extraction")
+            return reviews_data
+
         try:
             # 1. Ensure reviews section exists and is loaded
             try:
-                max_retries = 5
-                retry_delay = 5000 
+                max_retries = self.settings.getint('REVIEWS_SECTION_ATTEMPTS', 2)
+                section_timeout = self.settings.getint('REVIEWS_SECTION_TIMEOUT', 15000)
                 for attempt in range(max_retries):
                     try:
-                        await page.wait_for_selector('.mod-reviews', timeout=30000)  
+                        await page.wait_for_selector('.mod-reviews', timeout=section_timeout)
                         self.log_step("👀 REVIEWS SECTION FOUND", f"Found reviews container (attempt {attempt + 1})")
                         break
                     except Exception as e:
                         if attempt == max_retries - 1:
+                            # A missing section is treated as permanent: the product has no reviews block
+                            self.retry_policy.count('permanent', 'reviews_section_missing')
+                            await self.debug_capture.maybe_capture(page, response.request, 'reviews',
+                                                                   trigger='reviews_section_missing')
                             self.log_step("❌ REVIEWS SECTION TIMEOUT", 
-                                        f"Reviews section not found after {max_retries} attempts (30s each)")
+                                        f"Reviews section not found after {max_retries} attempts "
+                                        f"({section_timeout/1000:.0f}s each)")
                             return reviews_data
+                        retry_delay = self.retry_policy.backoff(attempt)
+                        self.retry_policy.count('transient', 'reviews_section_retried')
                         self.log_step("⚠️ REVIEWS RETRY", 
-                                    f"Attempt {attempt + 1} failed, retrying in {retry_delay/1000}s...")
-                        await page.wait_for_timeout(retry_delay)
+                                    f"Attempt {attempt + 1} failed, retrying in {retry_delay:.1f}s...")
                         
                         # Try scrolling to trigger lazy loading
                         await page.evaluate("window.scrollBy(0, 500)")
-                        await page.wait_for_timeout(1000)
+                        await page.wait_for_timeout(retry_delay * 1000)
             except Exception as e:
-                self.log_step("❌ REVIEWS SECTION TIMEOUT", "Reviews section not found after 30 seconds")
+                self.log_step("❌ REVIEWS SECTION TIMEOUT", f"Reviews section lookup failed: {e}")
                 return reviews_data
 
             # 2. Scroll to reviews section and wait
@@ -329,8 +469,18 @@ class DarazDetailedSpider(scrapy.Spider):
             scroll_attempts = 0
             max_scroll_attempts = 10
             scroll_timeout = 3000  # 3 seconds between scrolls
+            if expected_reviews is not None:
+                # Size the scroll budget from the listing's review count
+                per_scroll = self.settings.getint('REVIEWS_PER_SCROLL', 5)
+                max_scroll_attempts = min(max_scroll_attempts, max(1, math.ceil(expected_reviews / per_scroll)))
 
             while scroll_attempts < max_scroll_attempts:
+                if expected_reviews is not None:
+                    loaded = await page.evaluate("document.querySelectorAll('.mod-reviews .item').length")
+                    if loaded >= expected_reviews:
+                        self.log_step("✅ ALL REVIEWS LOADED", f"{loaded}/{expected_reviews} reviews present, stopping scroll")
+                        break
+
                 # Scroll to bottom of reviews section
                 await page.evaluate("""
                     const reviewSection = document.querySelector('.mod-reviews');
@@ -435,8 +585,8 @@ class DarazDetailedSpider(scrapy.Spider):
 
         except Exception as e:
             self.log_step("❌ REVIEW EXTRACTION ERROR", f"Failed to extract reviews: {e}")
-            # Take screenshot for debugging
-            await page.screenshot(path=f'debug_reviews_error_{int(time.time())}.png')
+            await self.debug_capture.maybe_capture(page, response.request, 'reviews',
+                                                   trigger='review_extraction_error')
 
         return reviews_data
 
@@ -538,6 +688,10 @@ class DarazDetailedSpider(scrapy.Spider):
             self.csv_file.close()
             self.log_step("📄 CSV CLOSED", f"CSV file closed: {self.csv_filename}")
 
+        # Wait for queued debug artifacts to hit the disk
+        self.debug_capture.close()
+        self.review_store.close()
+
         end_time = datetime.now()
         total_time = end_time - self.start_time
 
@@ -547,8 +701,13 @@ class DarazDetailedSpider(scrapy.Spider):
             'total_products': self.total_products,
             'processed_products': self.processed_products,
             'failed_products': self.failed_products,
+            'skipped_products': self.skipped_products,
             'success_rate': f"{self.processed_products/max(1, self.total_products)*100:.1f}%" if self.total_products > 0 else "N/A",
-            'csv_file': self.csv_filename
+            'csv_file': self.csv_filename,
+            'retry_policy': self.retry_policy.summary(),
+            'debug_capture': self.debug_capture.summary(),
+            'review_store': self.review_store.summary(),
+            'language_tagger': self.language_tagger.summary(),
         })
 
         print(f"\n{'='*80}")
@@ -556,7 +715,14 @@ class DarazDetailedSpider(scrapy.Spider):
         print(f"📊 Total Steps: {self.step_counter}")
         print(f"⏱️ Total Time: {total_time}")
         print(f"📦 Products: {self.processed_products}/{self.total_products} processed ({self.failed_products} failed)")
+        print(f"⏭️ Skipped below review threshold: {self.skipped_products}")
+        for error_class, counts in self.retry_policy.summary().items():
+            print(f"🔁 {error_class}: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+        tagged = self.language_tagger.summary()
+        print(f"🔤 Language tags: {tagged['fast']} by script, {tagged['markers']} by word list, "
+              f"{tagged['slow']} by detector ({tagged['cache_hits']} cached)")
         print(f"📁 Files Created:")
         print(f"   📋 Step Log: {self.step_log_file}")
         print(f"   📄 CSV Output: {self.csv_filename}")
+        print(f"   🗃️ Review Store: {self.review_store.path} ({self.review_store.summary()['reviews']} reviews)")
         print(f"{'='*80}")
\ No newline at end of file